@@ -0,0 +1,223 @@
+"""
+Сложение активности по дням в итог за период (GeneralActivity).
+
+ActivityAggregator принимает дни по одному и в любом порядке, не изменяет переданные
+объекты (подходят модели и из schemas.py, и из fast_schemas.py) и умеет объединяться
+с другим агрегатором, например, собранным из уже сохраненных дней. Каждая партия
+обрабатывается один раз, итог собирается за время, линейное по числу партий.
+"""
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Iterable, Optional
+
+import fast_schemas
+from schemas import GameType
+
+
+@dataclass(slots=True, frozen=True)
+class GeneralActivity:
+    from_date: Optional[date] = None
+    to_date: Optional[date] = None
+    games: list[fast_schemas.Game] = field(default_factory=list)
+    puzzles: Optional[fast_schemas.Puzzles] = None
+    correspondence_moves: Optional[fast_schemas.CorrespondenceMoves] = None
+    correspondence_ends: Optional[fast_schemas.CorrespondenceEnds] = None
+
+    @classmethod
+    def from_activities(cls, activities: Iterable) -> 'GeneralActivity':
+        aggregator = ActivityAggregator()
+        for activity in activities:
+            aggregator.add(activity)
+        return aggregator.result()
+
+
+class _Totals:
+    """Сумма результатов; рейтинг "до" берется из самого раннего дня, "после" - из самого позднего."""
+    __slots__ = ('wins', 'losses', 'draws', 'first_day', 'rating_before', 'last_day', 'rating_after', 'position')
+
+    def __init__(self, day: date, wins: int, losses: int, draws: int, rating_before: int, rating_after: int, position: int = 0):
+        self.wins = wins
+        self.losses = losses
+        self.draws = draws
+        self.first_day = day
+        self.rating_before = rating_before
+        self.last_day = day
+        self.rating_after = rating_after
+        # Место в списке самого позднего дня - по нему упорядочиваются виды игр
+        self.position = position
+
+    def add(self, day: date, wins: int, losses: int, draws: int, rating_before: int, rating_after: int, position: int = 0) -> None:
+        self.wins += wins
+        self.losses += losses
+        self.draws += draws
+        if day < self.first_day:
+            self.first_day = day
+            self.rating_before = rating_before
+        elif day > self.last_day:
+            self.last_day = day
+            self.rating_after = rating_after
+            self.position = position
+
+    def merge(self, other: '_Totals') -> None:
+        self.wins += other.wins
+        self.losses += other.losses
+        self.draws += other.draws
+        if other.first_day < self.first_day:
+            self.first_day = other.first_day
+            self.rating_before = other.rating_before
+        if other.last_day > self.last_day:
+            self.last_day = other.last_day
+            self.rating_after = other.rating_after
+            self.position = other.position
+
+    def copy(self) -> '_Totals':
+        totals = _Totals(self.first_day, self.wins, self.losses, self.draws, self.rating_before, self.rating_after, self.position)
+        totals.last_day = self.last_day
+        return totals
+
+
+class _CorrespondenceGames:
+    """
+    Партии по переписке за период: по каждому сопернику показываем только партии из последнего
+    дня, в котором он встречался. Индекс соперник -> последний день живет все время агрегации,
+    поэтому добавление дня не перебирает уже накопленные партии.
+    """
+    __slots__ = ('by_day', 'last_seen')
+
+    def __init__(self):
+        self.by_day: dict[date, list] = {}
+        self.last_seen: dict[str, date] = {}
+
+    def add(self, day: date, games: list) -> None:
+        self.by_day[day] = games
+        last_seen = self.last_seen
+        for game in games:
+            seen = last_seen.get(game.opponent_username)
+            if seen is None or day > seen:
+                last_seen[game.opponent_username] = day
+
+    def merge(self, other: '_CorrespondenceGames') -> None:
+        for day, games in other.by_day.items():
+            self.add(day, games)
+
+    def result(self) -> list:
+        last_seen = self.last_seen
+        return [
+            game
+            for day in sorted(self.by_day, reverse=True)
+            for game in self.by_day[day]
+            if last_seen[game.opponent_username] == day
+        ]
+
+
+class ActivityAggregator:
+    def __init__(self):
+        self.days: set[date] = set()
+        self._games: dict[GameType, _Totals] = {}
+        self._puzzles: Optional[_Totals] = None
+        self._total_moves = 0
+        self._moves: Optional[_CorrespondenceGames] = None
+        self._ends: Optional[_Totals] = None
+        self._ends_games: Optional[_CorrespondenceGames] = None
+
+    def add(self, activity) -> None:
+        day = activity.date
+        if day in self.days:
+            raise ValueError(f'Activity for {day} has already been added')
+        self.days.add(day)
+
+        games = activity.games
+        if games:
+            totals_by_type = self._games
+            position = 0
+            for game in games:
+                totals = totals_by_type.get(game.type)
+                if totals is None:
+                    totals_by_type[game.type] = _Totals(
+                        day, game.wins, game.losses, game.draws, game.rating_before, game.rating_after, position
+                    )
+                else:
+                    totals.add(day, game.wins, game.losses, game.draws, game.rating_before, game.rating_after, position)
+                position += 1
+
+        puzzles = activity.puzzles
+        if puzzles:
+            if self._puzzles is None:
+                self._puzzles = _Totals(day, puzzles.wins, puzzles.losses, 0, puzzles.rating_before, puzzles.rating_after)
+            else:
+                self._puzzles.add(day, puzzles.wins, puzzles.losses, 0, puzzles.rating_before, puzzles.rating_after)
+
+        moves = activity.correspondence_moves
+        if moves:
+            if self._moves is None:
+                self._moves = _CorrespondenceGames()
+            self._total_moves += moves.total_moves
+            self._moves.add(day, moves.games)
+
+        ends = activity.correspondence_ends
+        if ends:
+            if self._ends is None:
+                self._ends = _Totals(day, ends.wins, ends.losses, ends.draws, ends.rating_before, ends.rating_after)
+                self._ends_games = _CorrespondenceGames()
+            else:
+                self._ends.add(day, ends.wins, ends.losses, ends.draws, ends.rating_before, ends.rating_after)
+            self._ends_games.add(day, ends.games)
+
+    def merge(self, other: 'ActivityAggregator') -> 'ActivityAggregator':
+        """Добавляет к этому агрегатору другой, собранный из других дней."""
+        overlap = self.days & other.days
+        if overlap:
+            raise ValueError(f'Cannot merge aggregates with common days: {", ".join(map(str, sorted(overlap)))}')
+        self.days |= other.days
+
+        for game_type, other_totals in other._games.items():
+            totals = self._games.get(game_type)
+            if totals is None:
+                self._games[game_type] = other_totals.copy()
+            else:
+                totals.merge(other_totals)
+
+        if other._puzzles is not None:
+            if self._puzzles is None:
+                self._puzzles = other._puzzles.copy()
+            else:
+                self._puzzles.merge(other._puzzles)
+
+        if other._moves is not None:
+            if self._moves is None:
+                self._moves = _CorrespondenceGames()
+            self._total_moves += other._total_moves
+            self._moves.merge(other._moves)
+
+        if other._ends is not None:
+            if self._ends is None:
+                self._ends = other._ends.copy()
+                self._ends_games = _CorrespondenceGames()
+            else:
+                self._ends.merge(other._ends)
+            self._ends_games.merge(other._ends_games)
+        return self
+
+    def result(self) -> GeneralActivity:
+        if not self.days:
+            return GeneralActivity()
+
+        ordered = sorted(self._games.items(), key=lambda item: (item[1].last_day, -item[1].position), reverse=True)
+        games = [
+            fast_schemas.Game(game_type, t.wins, t.losses, t.draws, t.rating_before, t.rating_after)
+            for game_type, t in ordered
+        ]
+        puzzles = None
+        if self._puzzles is not None:
+            t = self._puzzles
+            puzzles = fast_schemas.Puzzles(t.wins, t.losses, t.rating_before, t.rating_after)
+        moves = None
+        if self._moves is not None:
+            moves = fast_schemas.CorrespondenceMoves(self._total_moves, self._moves.result())
+        ends = None
+        if self._ends is not None:
+            t = self._ends
+            ends = fast_schemas.CorrespondenceEnds(
+                t.wins, t.losses, t.draws, t.rating_before, t.rating_after, self._ends_games.result()
+            )
+        return GeneralActivity(min(self.days), max(self.days), games, puzzles, moves, ends)
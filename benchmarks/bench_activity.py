@@ -0,0 +1,162 @@
+# Бенчмарк конвейера активности: разбор -> агрегация (ActivityAggregator) -> формирование сообщения.
+# Сеть не нужна: ответы Lichess берутся из benchmarks/fixtures. Это не записанные ответы, а синтетические,
+# сгенерированные make_fixtures.py по формату API: размеры и состав дней подобраны вручную, поэтому
+# цифры годятся для сравнения версий между собой, а не как оценка времени на реальных игроках.
+#
+#   python benchmarks/bench_activity.py --output before.json
+#   python benchmarks/bench_activity.py --compare before.json
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import settings  # noqa: E402
+from aggregate import GeneralActivity  # noqa: E402
+from lichess import decode_activities, iter_activities, render_activity_message  # noqa: E402
+
+FIXTURES_DIR = os.path.join(ROOT, 'benchmarks', 'fixtures')
+USERNAME = 'Bench_User-1'
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def measure(run: Callable[[object], object], prepare: Callable[[], object], iterations: int, warmup: int) -> dict:
+    """prepare() вызывается вне замера, его результат передается в run()."""
+    for _ in range(warmup):
+        run(prepare())
+
+    timings = []
+    for _ in range(iterations):
+        arg = prepare()
+        started = time.perf_counter()
+        run(arg)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+
+    # Память меряем отдельным прогоном: tracemalloc сильно искажает время
+    arg = prepare()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    run(arg)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocations = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    total = sum(timings)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': iterations / total if total else 0.0,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'p50_us': percentile(timings, 50) * 1e6,
+        'p95_us': percentile(timings, 95) * 1e6,
+        'p99_us': percentile(timings, 99) * 1e6,
+        'peak_memory_bytes': peak,
+        'live_allocations': allocations,
+    }
+
+
+def bench_fixture(body: bytes, decoder: str, iterations: int, warmup: int) -> dict:
+    settings.ACTIVITY_DECODER = decoder
+    activities = decode_activities(body)
+    general_activity = GeneralActivity.from_activities(activities)
+    return {
+        'parse': measure(lambda _: decode_activities(body), lambda: None, iterations, warmup),
+        # Агрегатор не изменяет переданные дни, поэтому один разбор годится для всех итераций
+        'aggregate': measure(GeneralActivity.from_activities, lambda: activities, iterations, warmup),
+        'render': measure(lambda _: render_activity_message(USERNAME, general_activity), lambda: None, iterations, warmup),
+        # Как в боте: дни разбираются по одному во время агрегации
+        'pipeline': measure(
+            lambda _: render_activity_message(USERNAME, GeneralActivity.from_activities(iter_activities(body))),
+            lambda: None,
+            iterations,
+            warmup,
+        ),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results: dict, baseline: dict = None) -> None:
+    print(f'{"fixture":<22}{"decoder":<10}{"stage":<11}{"ops/s":>10}{"p50 us":>10}{"p95 us":>10}{"p99 us":>10}{"peak KiB":>10}{"allocs":>8}')
+    for fixture, by_decoder in results['fixtures'].items():
+        for decoder, stages in by_decoder.items():
+            for stage, r in stages.items():
+                line = (
+                    f'{fixture:<22}{decoder:<10}{stage:<11}{r["ops_per_sec"]:>10.0f}{r["p50_us"]:>10.1f}'
+                    f'{r["p95_us"]:>10.1f}{r["p99_us"]:>10.1f}{r["peak_memory_bytes"] / 1024:>10.1f}{r["live_allocations"]:>8}'
+                )
+                try:
+                    old = baseline['fixtures'][fixture][decoder][stage]
+                    line += f'   p50 {(r["p50_us"] / old["p50_us"] - 1) * 100:+.1f}%'
+                except (KeyError, TypeError, ZeroDivisionError):
+                    pass
+                print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк разбора, агрегации и формирования сообщения об активности')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--decoders', nargs='+', default=['pydantic', 'fast'])
+    parser.add_argument('--fixtures', nargs='*', help='имена файлов из benchmarks/fixtures без .json')
+    parser.add_argument('--output', help='куда сохранить результаты в JSON')
+    parser.add_argument('--compare', help='JSON с результатами предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.json')), key=os.path.getsize)
+    if args.fixtures:
+        paths = [path for path in paths if os.path.splitext(os.path.basename(path))[0] in args.fixtures]
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'iterations': args.iterations,
+        'fixtures': {},
+    }
+    for path in paths:
+        with open(path, 'rb') as f:
+            body = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        results['fixtures'][name] = {
+            decoder: bench_fixture(body, decoder, args.iterations, args.warmup) for decoder in args.decoders
+        }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+# Локальные заглушки Lichess и Telegram Bot API для нагрузочного теста (load_test.py).
+# Lichess отдает ответы активности из benchmarks/fixtures (синтетические, см. make_fixtures.py) с настраиваемой задержкой
+# и умеет отвечать 429 и 404; Telegram принимает любые методы и отвечает как настоящий API.
+#
+#   python benchmarks/fake_services.py --lichess-port 8081 --telegram-port 8082 --latency 0.2
+#   LICHESS_BASE_URL=http://127.0.0.1:8081 python main.py  # настоящий Telegram, Lichess - заглушка
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import random
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+import tornado.netutil
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.1  # средняя задержка ответа Lichess, с
+    jitter: float = 0.05  # разброс задержки (равномерно в обе стороны)
+    rate_limit_ratio: float = 0.0  # доля запросов, на которые Lichess отвечает 429
+    retry_after: int = 1
+    not_found_ratio: float = 0.0  # доля ников, которых "нет" на Lichess (всегда одни и те же)
+    telegram_latency: float = 0.02
+    fixtures_dir: str = FIXTURES_DIR
+    fixtures: list[bytes] = field(default_factory=list)
+
+    def load_fixtures(self) -> None:
+        paths = sorted(glob.glob(os.path.join(self.fixtures_dir, '*.json')))
+        if not paths:
+            raise FileNotFoundError(f'No activity fixtures in {self.fixtures_dir}, run benchmarks/make_fixtures.py')
+        self.fixtures = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                self.fixtures.append(f.read())
+
+
+def _bucket(value: str, salt: bytes = b'') -> float:
+    """Детерминированное число из [0, 1) для ника: один и тот же ник всегда ведет себя одинаково."""
+    return zlib.crc32(salt + value.lower().encode()) / 2 ** 32
+
+
+class FakeHandler(tornado.web.RequestHandler):
+    def initialize(self, config: FakeConfig, stats: Counter):
+        self.config = config
+        self.stats = stats
+
+    def send_json(self, data, status: int = 200) -> None:
+        self.set_status(status)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(json.dumps(data))
+
+
+class LichessHandler(FakeHandler):
+    async def prepare(self):
+        config = self.config
+        self.stats['requests'] += 1
+        await asyncio.sleep(max(config.latency + random.uniform(-config.jitter, config.jitter), 0))
+        if config.rate_limit_ratio and random.random() < config.rate_limit_ratio:
+            self.stats['429'] += 1
+            self.set_header('Retry-After', str(config.retry_after))
+            self.send_json({'error': 'Too many requests'}, 429)
+
+    def is_missing(self, username: str) -> bool:
+        return _bucket(username, b'404') < self.config.not_found_ratio
+
+    def not_found(self) -> None:
+        self.stats['404'] += 1
+        self.send_json({'error': 'Not found'}, 404)
+
+
+class LichessUserHandler(LichessHandler):
+    async def get(self, username: str):
+        if self.is_missing(username):
+            return self.not_found()
+        self.stats['user'] += 1
+        self.send_json({'id': username.lower(), 'username': username})
+
+
+class LichessActivityHandler(LichessHandler):
+    async def get(self, username: str):
+        if self.is_missing(username):
+            return self.not_found()
+        fixtures = self.config.fixtures
+        body = fixtures[int(_bucket(username) * len(fixtures))]
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.request.headers.get('If-None-Match') == etag:
+            self.stats['304'] += 1
+            self.set_status(304)
+            return self.finish()
+        self.stats['activity'] += 1
+        self.set_header('ETag', etag)
+        self.set_header('Content-Type', 'application/json')
+        self.finish(body)
+
+
+class LichessUsersHandler(LichessHandler):
+    async def post(self):
+        self.stats['users'] += 1
+        names = [name for name in self.request.body.decode().split(',') if name and not self.is_missing(name)]
+        self.send_json([
+            {
+                'id': name.lower(),
+                'username': name,
+                'perfs': {'blitz': {'games': 100, 'rating': 1200 + int(_bucket(name) * 1000), 'prov': False}},
+            }
+            for name in names
+        ])
+
+
+class StatsHandler(FakeHandler):
+    def get(self):
+        self.send_json(dict(self.stats))
+
+
+class TelegramHandler(FakeHandler):
+    message_ids = iter(range(1, 2 ** 62))
+
+    def parameters(self) -> dict:
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(self.request.body or b'{}')
+        return {name: self.get_body_argument(name) for name in self.request.body_arguments}
+
+    def message(self, params: dict) -> dict:
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def post(self, token: str, method: str):
+        self.stats[method] += 1
+        await asyncio.sleep(self.config.telegram_latency)
+        params = self.parameters()
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Load test', 'username': 'load_test_bot'}
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self.message(params)
+        else:
+            result = True
+        self.send_json({'ok': True, 'result': result})
+
+
+def _no_access_log(handler: tornado.web.RequestHandler) -> None:
+    pass
+
+
+def make_lichess_app(config: FakeConfig, stats: Counter) -> tornado.web.Application:
+    kwargs = {'config': config, 'stats': stats}
+    return tornado.web.Application(log_function=_no_access_log, handlers=[
+        (r'/_stats', StatsHandler, kwargs),
+        (r'/api/user/([^/]+)/activity', LichessActivityHandler, kwargs),
+        (r'/api/user/([^/]+)', LichessUserHandler, kwargs),
+        (r'/api/users', LichessUsersHandler, kwargs),
+    ])
+
+
+def make_telegram_app(config: FakeConfig, stats: Counter) -> tornado.web.Application:
+    kwargs = {'config': config, 'stats': stats}
+    return tornado.web.Application(log_function=_no_access_log, handlers=[
+        (r'/_stats', StatsHandler, kwargs),
+        (r'/bot([^/]+)/(\w+)', TelegramHandler, kwargs),
+    ])
+
+
+def _listen(app: tornado.web.Application, host: str, port: int) -> int:
+    sockets = tornado.netutil.bind_sockets(port, host)
+    HTTPServer(app).add_sockets(sockets)
+    return sockets[0].getsockname()[1]
+
+
+async def serve(config: FakeConfig, host: str = '127.0.0.1', lichess_port: int = 0, telegram_port: int = 0, ready=None) -> None:
+    """Запускает обе заглушки (порт 0 - любой свободный). В ready (очередь) кладутся фактические порты."""
+    if not config.fixtures:
+        config.load_fixtures()
+    lichess_port = _listen(make_lichess_app(config, Counter()), host, lichess_port)
+    telegram_port = _listen(make_telegram_app(config, Counter()), host, telegram_port)
+    if ready is not None:
+        ready.put((lichess_port, telegram_port))
+    await asyncio.Event().wait()
+
+
+def run_in_process(config: FakeConfig, ready, host: str = '127.0.0.1') -> None:
+    """Точка входа для multiprocessing: заглушки в отдельном процессе не нагружают цикл событий бота."""
+    asyncio.run(serve(config, host, ready=ready))
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Заглушки Lichess и Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--lichess-port', type=int, default=8081)
+    parser.add_argument('--telegram-port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=FakeConfig.latency)
+    parser.add_argument('--jitter', type=float, default=FakeConfig.jitter)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0)
+    parser.add_argument('--not-found-ratio', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=FakeConfig.telegram_latency)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    args = parser.parse_args(argv)
+
+    config = FakeConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        not_found_ratio=args.not_found_ratio,
+        telegram_latency=args.telegram_latency,
+        fixtures_dir=args.fixtures,
+    )
+    print(f'Lichess on http://{args.host}:{args.lichess_port}, Telegram on http://{args.host}:{args.telegram_port}/bot')
+    asyncio.run(serve(config, args.host, args.lichess_port, args.telegram_port))
+
+
+if __name__ == '__main__':
+    main()
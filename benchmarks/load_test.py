@@ -0,0 +1,336 @@
+# Нагрузочный тест бота без сети: обработчики main.py (command_start, handle_message, command_users)
+# работают как в бою, но Lichess и Telegram Bot API заменены заглушками из fake_services.py,
+# запущенными в отдельном процессе. Нужна отдельная база PostgreSQL (--database-url или
+# LOAD_TEST_DATABASE_URL, не та, что в DATABASE_URL/data.py): тест применяет к ней миграции,
+# создает пользователей с tg_id от --chat-id-base и удаляет их после прогона.
+#
+# Каждый чат проходит сценарий нового пользователя: /start -> ник на Lichess -> /start.
+# Время ответа считается от постановки апдейта в очередь до ответа Bot API на sendMessage.
+#
+#   export LOAD_TEST_DATABASE_URL=postgresql://localhost/lichess_bot_load_test
+#   python benchmarks/load_test.py --chats 2000 --concurrency 200
+#   python benchmarks/load_test.py --chats 5000 --players 300 --lichess-latency 0.3 --rate-limit-ratio 0.01 --output after.json
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.request import HTTPXRequest  # noqa: E402
+
+import settings  # noqa: E402
+from bench_activity import git_revision, percentile  # noqa: E402
+from fake_services import FIXTURES_DIR, FakeConfig, run_in_process  # noqa: E402
+from post_update import make_text_update  # noqa: E402
+
+# Сообщения, которые бот шлет админу сам по себе - это не ответ на /_users
+ADMIN_NOTIFICATIONS = ('Добавлен пользователь', 'Не удалось получить активность пользователя @')
+PLAYER_PREFIX = 'LoadTest_'
+
+
+class ReplyRecorder:
+    """Связывает исходящие сообщения бота с апдейтами, которые их вызвали: первый ответ в чат - ответ на самый ранний запрос."""
+
+    def __init__(self, admin_id: int):
+        self.admin_id = admin_id
+        self._waiting: dict[int, deque[asyncio.Future]] = defaultdict(deque)
+        self.unexpected = 0
+
+    def expect(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[chat_id].append(future)
+        return future
+
+    def reply(self, chat_id: int, text: str) -> None:
+        if chat_id == self.admin_id and text.startswith(ADMIN_NOTIFICATIONS):
+            return
+        waiting = self._waiting.get(chat_id)
+        while waiting:
+            future = waiting.popleft()
+            if not future.done():
+                future.set_result(time.perf_counter())
+                return
+        self.unexpected += 1
+
+
+class RecordingRequest(HTTPXRequest):
+    def __init__(self, recorder: ReplyRecorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = await super().do_request(url, method, request_data, **kwargs)
+        endpoint = url.rsplit('/', 1)[-1]
+        if endpoint in ('sendMessage', 'editMessageText') and request_data is not None:
+            parameters = request_data.parameters
+            self.recorder.reply(int(parameters['chat_id']), str(parameters.get('text', '')))
+        return result
+
+
+class LoadTest:
+    def __init__(self, app, recorder: ReplyRecorder, args):
+        self.app = app
+        self.recorder = recorder
+        self.args = args
+        self.update_ids = itertools.count(1)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.timeouts: dict[str, int] = defaultdict(int)
+        self.updates = 0
+        self.loop_lag: list[float] = []
+
+    async def step(self, chat_id: int, text: str, kind: str) -> bool:
+        reply = self.recorder.expect(chat_id)
+        update = Update.de_json(make_text_update(next(self.update_ids), chat_id, text), self.app.bot)
+        sent = time.perf_counter()
+        await self.app.update_queue.put(update)
+        self.updates += 1
+        try:
+            replied = await asyncio.wait_for(reply, self.args.reply_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts[kind] += 1
+            return False
+        self.latencies[kind].append(replied - sent)
+        if self.args.think_time:
+            await asyncio.sleep(self.args.think_time)
+        return True
+
+    async def simulate_chat(self, no: int) -> None:
+        chat_id = self.args.chat_id_base + no
+        # Несколько чатов на одного игрока: так видно, как работают кэши и объединение запросов
+        player = f'{PLAYER_PREFIX}{no % self.args.players}'
+        if not await self.step(chat_id, '/start', 'start_new'):
+            return
+        if not await self.step(chat_id, player.lower(), 'set_username'):
+            return
+        await self.step(chat_id, '/start', 'start_existing')
+
+    async def admin(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            await self.step(self.recorder.admin_id, '/_users', 'users')
+            try:
+                await asyncio.wait_for(stop.wait(), self.args.admin_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def monitor_loop_lag(self, stop: asyncio.Event, interval: float = 0.05) -> None:
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(loop.time() - expected, 0.0))
+
+    async def run(self) -> float:
+        stop = asyncio.Event()
+        background = [asyncio.create_task(self.monitor_loop_lag(stop))]
+        if self.args.admin_interval:
+            background.append(asyncio.create_task(self.admin(stop)))
+
+        started = time.perf_counter()
+        if self.args.arrival_rate:
+            # Открытая модель: новые чаты приходят с заданной частотой, сколько бы ни было в работе
+            tasks = []
+            for no in range(self.args.chats):
+                tasks.append(asyncio.create_task(self.simulate_chat(no)))
+                await asyncio.sleep(1 / self.args.arrival_rate)
+            await asyncio.gather(*tasks)
+        else:
+            slots = asyncio.Semaphore(self.args.concurrency)
+
+            async def limited(no: int) -> None:
+                async with slots:
+                    await self.simulate_chat(no)
+            await asyncio.gather(*(limited(no) for no in range(self.args.chats)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await asyncio.gather(*background)
+        return elapsed
+
+
+def summarize(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'mean_ms': statistics.fmean(values) * 1000 if values else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': (values[-1] if values else 0.0) * 1000,
+    }
+
+
+def print_report(results: dict) -> None:
+    print(
+        f'\nЧатов: {results["chats"]}, апдейтов: {results["updates"]}, за {results["elapsed_s"]:.1f}s '
+        f'-> {results["replies_per_sec"]:.1f} ответов/с'
+    )
+    print(f'{"step":<16}{"count":>8}{"timeouts":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for kind, r in results['steps'].items():
+        print(f'{kind:<16}{r["count"]:>8}{r["timeouts"]:>10}{r["p50_ms"]:>10.1f}{r["p95_ms"]:>10.1f}{r["p99_ms"]:>10.1f}{r["max_ms"]:>10.1f}')
+    lag = results['loop_lag']
+    print(f'Задержка цикла событий: p50 {lag["p50_ms"]:.1f} ms, p95 {lag["p95_ms"]:.1f} ms, p99 {lag["p99_ms"]:.1f} ms, max {lag["max_ms"]:.1f} ms')
+    print(f'Lichess: {results["lichess"]}')
+    print(f'Telegram: {results["telegram"]}')
+    if results['unexpected_replies']:
+        print(f'Ответов без запроса: {results["unexpected_replies"]}')
+
+
+async def cleanup(args) -> None:
+    from database import Database
+    async with Database()._acquire() as conn:
+        last_id = args.chat_id_base + args.chats
+        await conn.execute('DELETE FROM conversation_state WHERE chat_id >= $1 AND chat_id < $2;', args.chat_id_base, last_id)
+        await conn.execute('DELETE FROM users WHERE tg_id >= $1 AND tg_id < $2;', args.chat_id_base, last_id)
+        players = PLAYER_PREFIX.lower().replace('_', '\\_') + '%'
+        await conn.execute('DELETE FROM activity_days WHERE lichess_username LIKE $1;', players)
+        await conn.execute('DELETE FROM ratings WHERE lichess_id LIKE $1;', players)
+        await conn.execute('DELETE FROM rating_history WHERE lichess_id LIKE $1;', players)
+
+
+async def run_load_test(args, lichess_url: str, telegram_url: str) -> dict:
+    settings.DATABASE_URL = args.database_url
+    settings.LICHESS_BASE_URL = lichess_url
+    settings.METRICS_PORT = 0
+    settings.USER_CACHE_WARM_UP = args.warm_up
+    if args.lichess_rate:
+        settings.LICHESS_RATE = args.lichess_rate
+        settings.LICHESS_BURST = max(settings.LICHESS_BURST, args.lichess_rate)
+    if args.lichess_concurrency:
+        settings.LICHESS_MAX_CONCURRENT_REQUESTS = args.lichess_concurrency
+    if args.max_concurrent_updates:
+        settings.MAX_CONCURRENT_UPDATES = args.max_concurrent_updates
+
+    import logging
+    import main
+    from conversation import MemoryConversationStore
+    from data import MY_ID
+    from database import Database
+    from logging_config import setup_logging
+
+    setup_logging()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    # То же, что в блоке __main__ в main.py
+    main.started_at = time.perf_counter()
+    main.db = Database()
+    main.conversations = main.db if settings.CONVERSATION_STORE == 'postgres' else MemoryConversationStore()
+    main.bot_commands = main.bot_commands_admin = []
+    main.commands_version = ''
+
+    await cleanup(args)
+    recorder = ReplyRecorder(MY_ID)
+    request = RecordingRequest(recorder, connection_pool_size=args.telegram_connections)
+    app = main.build_application(base_url=telegram_url, request=request, rate_limiter=args.telegram_rate_limiter)
+    await app.initialize()
+    await main.post_init(app)
+    await app.start()
+    try:
+        test = LoadTest(app, recorder, args)
+        elapsed = await test.run()
+    finally:
+        await app.stop()
+        await cleanup(args)
+        await app.shutdown()
+        await main.post_shutdown(app)
+
+    replies = sum(len(values) for values in test.latencies.values())
+    async with httpx.AsyncClient() as client:
+        lichess_stats = (await client.get(f'{lichess_url}/_stats')).json()
+        telegram_stats = (await client.get(telegram_url.removesuffix('/bot') + '/_stats')).json()
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'chats': args.chats,
+        'updates': test.updates,
+        'elapsed_s': elapsed,
+        'replies_per_sec': replies / elapsed if elapsed else 0.0,
+        'steps': {
+            kind: {**summarize(test.latencies[kind]), 'timeouts': test.timeouts[kind]}
+            for kind in ('start_new', 'set_username', 'start_existing', 'users')
+            if test.latencies[kind] or test.timeouts[kind]
+        },
+        'loop_lag': summarize(test.loop_lag),
+        'lichess': lichess_stats,
+        'telegram': telegram_stats,
+        'unexpected_replies': recorder.unexpected,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный тест бота с заглушками Lichess и Telegram')
+    parser.add_argument(
+        '--database-url',
+        default=os.getenv('LOAD_TEST_DATABASE_URL'),
+        help='отдельная база для теста (по умолчанию LOAD_TEST_DATABASE_URL)',
+    )
+    parser.add_argument('--chats', type=int, default=1000, help='сколько чатов проходят сценарий')
+    parser.add_argument('--concurrency', type=int, default=100, help='сколько чатов активны одновременно')
+    parser.add_argument('--arrival-rate', type=float, default=0.0, help='новых чатов в секунду (вместо --concurrency)')
+    parser.add_argument('--players', type=int, default=500, help='сколько разных игроков Lichess на все чаты')
+    parser.add_argument('--think-time', type=float, default=0.0, help='пауза между шагами сценария, с')
+    parser.add_argument('--reply-timeout', type=float, default=60.0)
+    parser.add_argument('--admin-interval', type=float, default=1.0, help='как часто админ вызывает /_users, с (0 - никогда)')
+    parser.add_argument('--chat-id-base', type=int, default=9 * 10 ** 15)
+    parser.add_argument('--lichess-latency', type=float, default=FakeConfig.latency)
+    parser.add_argument('--lichess-jitter', type=float, default=FakeConfig.jitter)
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='доля ответов Lichess 429')
+    parser.add_argument('--retry-after', type=int, default=FakeConfig.retry_after)
+    parser.add_argument('--not-found-ratio', type=float, default=0.0, help='доля ников, которых нет на Lichess (404)')
+    parser.add_argument('--telegram-latency', type=float, default=FakeConfig.telegram_latency)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='папка с ответами активности (синтетические, см. make_fixtures.py)')
+    parser.add_argument('--lichess-rate', type=float, help='переопределить LICHESS_RATE, запросов/с')
+    parser.add_argument('--lichess-concurrency', type=int, help='переопределить LICHESS_MAX_CONCURRENT_REQUESTS')
+    parser.add_argument('--max-concurrent-updates', type=int, help='переопределить MAX_CONCURRENT_UPDATES')
+    parser.add_argument('--telegram-connections', type=int, default=256)
+    parser.add_argument('--telegram-rate-limiter', action='store_true', help='включить ограничение частоты Bot API, как в бою')
+    parser.add_argument('--warm-up', action='store_true', help='прогревать кэш пользователей при старте')
+    parser.add_argument('--output', help='куда сохранить результаты в JSON')
+    args = parser.parse_args(argv)
+    # Тест пишет в базу синтетических пользователей и состояние диалогов - рабочую базу не трогаем
+    if not args.database_url:
+        parser.error('нужна отдельная база для теста: --database-url или LOAD_TEST_DATABASE_URL')
+    if args.database_url == settings.DATABASE_URL:
+        parser.error('--database-url совпадает с DATABASE_URL бота, нужна отдельная база')
+
+    config = FakeConfig(
+        latency=args.lichess_latency,
+        jitter=args.lichess_jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        not_found_ratio=args.not_found_ratio,
+        telegram_latency=args.telegram_latency,
+        fixtures_dir=args.fixtures,
+    )
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    fakes = context.Process(target=run_in_process, args=(config, ready), daemon=True)
+    fakes.start()
+    try:
+        lichess_port, telegram_port = ready.get(timeout=30)
+        results = asyncio.run(run_load_test(args, f'http://127.0.0.1:{lichess_port}', f'http://127.0.0.1:{telegram_port}/bot'))
+    finally:
+        fakes.terminate()
+        fakes.join()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
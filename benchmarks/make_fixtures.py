@@ -0,0 +1,110 @@
+# Генерирует корпус для bench_activity.py: синтетические (не записанные с Lichess) ответы
+# /api/user/{username}/activity в формате Lichess, от одного дня с парой партий до тяжелых
+# любителей переписки и задач. Генератор детерминированный, файлы в fixtures/ - его вывод.
+# Ники соперников специально содержат '_' и '-', чтобы нагружать экранирование.
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+DAY = 86400000
+START = 1758844800000  # 2025-09-26 00:00 UTC
+GAME_TYPES = [
+    'bullet', 'blitz', 'rapid', 'classical', 'chess960',
+    'atomic', 'crazyhouse', 'ultraBullet', 'kingOfTheHill', 'threeCheck',
+]
+GAME_ID_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def rating_progress(rnd: random.Random, base: int) -> dict:
+    before = base + rnd.randint(-50, 50)
+    return {'before': before, 'after': before + rnd.randint(-30, 30)}
+
+
+def correspondence_game(rnd: random.Random, opponents: list[str]) -> dict:
+    game_id = ''.join(rnd.choice(GAME_ID_ALPHABET) for _ in range(8))
+    color = rnd.choice(['white', 'black'])
+    return {
+        'id': game_id,
+        'color': color,
+        'url': f'https://lichess.org/{game_id}/{color}',
+        'opponent': {'user': rnd.choice(opponents), 'rating': rnd.randint(1200, 2300)},
+    }
+
+
+def make_activity(
+    seed: int,
+    days: int,
+    max_game_types: int,
+    max_puzzles: int,
+    correspondence_games: int = 0,
+    tournaments: bool = False,
+) -> list[dict]:
+    rnd = random.Random(seed)
+    opponents = [f'Opp{"_-"[i % 3] if i % 3 < 2 else ""}{i}' for i in range(max(correspondence_games * 3, 1))]
+    activity = []
+    for day in range(days):
+        start = START - day * DAY
+        item = {'interval': {'start': start, 'end': start + DAY}}
+        if max_game_types:
+            item['games'] = {
+                game_type: {
+                    'win': rnd.randint(0, 6),
+                    'loss': rnd.randint(0, 6),
+                    'draw': rnd.randint(0, 2),
+                    'rp': rating_progress(rnd, 1600),
+                }
+                for game_type in rnd.sample(GAME_TYPES, rnd.randint(1, max_game_types))
+            }
+        if max_puzzles and rnd.random() < 0.8:
+            item['puzzles'] = {'score': {
+                'win': rnd.randint(1, max_puzzles),
+                'loss': rnd.randint(0, max_puzzles // 2),
+                'draw': 0,
+                'rp': rating_progress(rnd, 1900),
+            }}
+        if correspondence_games:
+            item['correspondenceMoves'] = {
+                'nb': rnd.randint(1, correspondence_games * 2),
+                'games': [correspondence_game(rnd, opponents) for _ in range(rnd.randint(1, correspondence_games))],
+            }
+            if rnd.random() < 0.5:
+                item['correspondenceEnds'] = {'correspondence': {
+                    'score': {
+                        'win': rnd.randint(0, 3),
+                        'loss': rnd.randint(0, 3),
+                        'draw': rnd.randint(0, 1),
+                        'rp': rating_progress(rnd, 1700),
+                    },
+                    'games': [correspondence_game(rnd, opponents) for _ in range(rnd.randint(1, correspondence_games))],
+                }}
+        if tournaments and rnd.random() < 0.3:
+            item['tournaments'] = {'nb': 1, 'best': [{
+                'tournament': {'id': 'abcd1234', 'name': 'Hourly Blitz Arena'},
+                'nbGames': rnd.randint(3, 15),
+                'score': rnd.randint(5, 30),
+                'rank': rnd.randint(1, 200),
+                'rankPercent': rnd.randint(1, 99),
+            }]}
+        if rnd.random() < 0.1:
+            item['follows'] = {'in': {'ids': ['someone']}, 'out': {'ids': ['other']}}
+        if rnd.random() < 0.05:
+            item['teams'] = [{'url': '/team/lichess-swiss', 'name': 'Lichess Swiss'}]
+        activity.append(item)
+    return activity
+
+
+FIXTURES = {
+    'tiny': lambda: make_activity(1, days=1, max_game_types=1, max_puzzles=0),
+    'casual': lambda: make_activity(2, days=7, max_game_types=2, max_puzzles=10, tournaments=True),
+    'active': lambda: make_activity(3, days=30, max_game_types=4, max_puzzles=40, tournaments=True),
+    'puzzles_heavy': lambda: make_activity(4, days=60, max_game_types=1, max_puzzles=300),
+    'correspondence_heavy': lambda: make_activity(5, days=60, max_game_types=2, max_puzzles=20, correspondence_games=40),
+}
+
+
+if __name__ == '__main__':
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, make in FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, f'{name}.json'), 'w', encoding='utf-8') as f:
+            json.dump(make(), f, separators=(',', ':'))
@@ -0,0 +1,46 @@
+"""
+Состояние диалогов с пользователями (например, "ждем ник на Lichess").
+
+Хранилище должно реализовывать методы get_conversation_state, set_conversation_state,
+delete_conversation_state и purge_conversation_state. Для нескольких процессов бота
+используется Database (таблица conversation_state), для тестов и одного процесса
+подойдет MemoryConversationStore.
+"""
+import time
+from typing import Optional
+
+AWAITING_LICHESS_USERNAME = 'awaiting_lichess_username'
+COMMANDS_VERSION = 'commands_version'
+
+
+class MemoryConversationStore:
+    def __init__(self):
+        self._data: dict[tuple[int, str], tuple[str, Optional[float]]] = {}
+
+    def _get_entry(self, chat_id: int, key: str) -> Optional[str]:
+        entry = self._data.get((chat_id, key))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[(chat_id, key)]
+            return None
+        return value
+
+    async def get_conversation_state(self, chat_id: int, key: str) -> Optional[str]:
+        return self._get_entry(chat_id, key)
+
+    async def set_conversation_state(self, chat_id: int, key: str, value: str = '1', ttl: Optional[float] = None) -> None:
+        self._data[(chat_id, key)] = (value, time.monotonic() + ttl if ttl is not None else None)
+
+    async def delete_conversation_state(self, chat_id: int, key: str) -> bool:
+        found = self._get_entry(chat_id, key) is not None
+        self._data.pop((chat_id, key), None)
+        return found
+
+    async def purge_conversation_state(self) -> int:
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
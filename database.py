@@ -1,39 +1,135 @@
+import asyncio
+import contextlib
 import logging
+import time
+from datetime import date
 from typing import Optional
 import functools
 
-import psycopg2
-from psycopg2.pool import SimpleConnectionPool
+import asyncpg
 
+import fast_schemas
+import settings
+from cache import TTLCache
 from data import db_dbname, db_host, db_user, db_password
-from schemas import User
+from migrations import apply_migrations
+import metrics
+from schemas import Color, GameType, User
 
-logger = logging.getLogger('httpx')
+logger = logging.getLogger(__name__)
 
+# Порядок важен: digests.sql ссылается на таблицу users
+MIGRATIONS = [
+    'sql/users.sql',
+    'sql/digests.sql',
+    'sql/activity.sql',
+    'sql/conversation.sql',
+    'sql/ratings.sql',
+]
 
-def with_db_connection(autocommit=True):
+# Запросы горячего пути пишем напрямую, а не через PL/pgSQL-функции: asyncpg готовит их
+# один раз на соединение и дальше берет из кэша (statement_cache_size)
+USER_COLUMNS = 'id, tg_id, tg_username, tg_first_name, tg_last_name, lichess_username'
+GET_USER_SQL = f'SELECT {USER_COLUMNS} FROM users WHERE tg_id = $1;'
+# Вставка только если пользователя нет: иначе ON CONFLICT тратил бы значение последовательности id
+GET_OR_CREATE_USER_SQL = f'''
+WITH existing AS (
+    SELECT {USER_COLUMNS}, false AS created FROM users WHERE tg_id = $1
+), inserted AS (
+    INSERT INTO users (tg_id, tg_username, tg_first_name, tg_last_name)
+    SELECT $1, $2, $3, $4
+    WHERE NOT EXISTS (SELECT 1 FROM existing)
+    ON CONFLICT (tg_id) DO NOTHING
+    RETURNING {USER_COLUMNS}, true AS created
+)
+SELECT * FROM existing
+UNION ALL
+SELECT * FROM inserted;
+'''
+UPDATE_LICHESS_USERNAME_SQL = 'UPDATE users SET lichess_username = $2 WHERE tg_id = $1;'
+GET_CONVERSATION_STATE_SQL = '''
+SELECT value FROM conversation_state
+WHERE chat_id = $1 AND key = $2 AND (expires_at IS NULL OR expires_at > now());
+'''
+SET_CONVERSATION_STATE_SQL = '''
+INSERT INTO conversation_state (chat_id, key, value, expires_at)
+VALUES ($1, $2, $3, now() + make_interval(secs => $4))
+ON CONFLICT (chat_id, key) DO UPDATE SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at;
+'''
+DELETE_CONVERSATION_STATE_SQL = '''
+DELETE FROM conversation_state
+WHERE chat_id = $1 AND key = $2 AND (expires_at IS NULL OR expires_at > now())
+RETURNING 1;
+'''
+GET_LICHESS_USERNAMES_SQL = 'SELECT DISTINCT lichess_username FROM users WHERE lichess_username IS NOT NULL;'
+STORE_RATING_HISTORY_SQL = '''
+INSERT INTO rating_history (lichess_id, game_type, day, rating)
+SELECT r.lichess_id, r.game_type, $1, r.rating
+FROM unnest($2::text[], $3::text[], $4::int[]) AS r(lichess_id, game_type, rating)
+ON CONFLICT (lichess_id, game_type, day) DO UPDATE SET rating = EXCLUDED.rating;
+'''
+# Изменение за неделю - от самого раннего рейтинга за последние 7 дней (история только что дописана,
+# поэтому он есть всегда)
+STORE_RATINGS_SQL = '''
+INSERT INTO ratings (lichess_id, game_type, lichess_username, rating, games, provisional, week_change, updated_at)
+SELECT r.lichess_id, r.game_type, r.lichess_username, r.rating, r.games, r.provisional, r.rating - week.rating, now()
+FROM unnest($2::text[], $3::text[], $4::text[], $5::int[], $6::int[], $7::boolean[])
+    AS r(lichess_id, game_type, lichess_username, rating, games, provisional)
+CROSS JOIN LATERAL (
+    SELECT h.rating FROM rating_history h
+    WHERE h.lichess_id = r.lichess_id AND h.game_type = r.game_type AND h.day >= $1::date - 7
+    ORDER BY h.day
+    LIMIT 1
+) week
+ON CONFLICT (lichess_id, game_type) DO UPDATE SET
+    lichess_username = EXCLUDED.lichess_username,
+    rating = EXCLUDED.rating,
+    games = EXCLUDED.games,
+    provisional = EXCLUDED.provisional,
+    week_change = EXCLUDED.week_change,
+    updated_at = EXCLUDED.updated_at;
+'''
+# Первые $2 строк по каждому виду игр - по одному проходу индекса ratings_top_idx / ratings_week_change_idx
+# на вид, поэтому время запроса не зависит от числа пользователей
+LEADERBOARD_SQL = '''
+SELECT t.game_type, r.lichess_username, r.rating, r.week_change
+FROM unnest($1::text[]) WITH ORDINALITY AS t(game_type, n)
+CROSS JOIN LATERAL (
+    SELECT r.lichess_username, r.rating, r.week_change FROM ratings r
+    WHERE r.game_type = t.game_type AND NOT r.provisional
+    ORDER BY r.{column} DESC
+    LIMIT $2
+) r
+ORDER BY t.n, r.{column} DESC;
+'''
+LEADERBOARD_BY_RATING_SQL = LEADERBOARD_SQL.format(column='rating')
+LEADERBOARD_BY_WEEK_CHANGE_SQL = LEADERBOARD_SQL.format(column='week_change')
+
+DB_ERRORS = (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, asyncpg.QueryCanceledError, OSError, asyncio.TimeoutError)
+
+
+def with_db_connection():
     def decorator(func):
+        query_seconds = metrics.histogram('db_query_seconds', 'Время запросов к базе (без ожидания соединения)', query=func.__name__)
+        errors = metrics.counter('db_errors_total', 'Ошибки базы данных', query=func.__name__)
+
         @functools.wraps(func)
-        def wrapper(self, *args, **kwargs):
-            conn = None
+        async def wrapper(self, *args, **kwargs):
             try:
-                conn = self._get_conn()
-                conn.autocommit = autocommit
-                result = func(self, conn, *args, **kwargs)
-                return result
-            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
-                logger.error(f'Database error in {func.__name__}: {e}')
+                async with self._acquire() as conn:
+                    with query_seconds.time():
+                        return await func(self, conn, *args, **kwargs)
+            except DB_ERRORS as e:
+                errors.inc()
+                logger.error(f'Database error in {func.__name__}: {e!r}')
                 return None
-            finally:
-                if conn:
-                    self._put_conn(conn)
         return wrapper
     return decorator
 
 
 class Database:
     _instance = None
-    _pool = None
+    _pool: Optional[asyncpg.Pool] = None
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -44,84 +140,360 @@ class Database:
         Database._instance = None
 
     def __init__(self):
-        if Database._pool is None:
+        if not hasattr(self, 'acquire_wait'):
+            self.acquire_wait = metrics.histogram('db_pool_acquire_wait_seconds', 'Ожидание свободного соединения в пуле')
+            self.user_cache = TTLCache(ttl=settings.USER_CACHE_TTL, max_entries=settings.USER_CACHE_MAX_ENTRIES)
+            metrics.register_cache('users', self.user_cache)
+            metrics.gauge('db_pool_size', lambda: self.pool_stats()['size'], 'Соединений в пуле')
+            metrics.gauge('db_pool_idle', lambda: self.pool_stats()['idle'], 'Свободных соединений в пуле')
+            metrics.gauge('db_pool_max_size', lambda: self.pool_stats()['max_size'], 'Максимум соединений в пуле')
+            metrics.gauge('db_connect_seconds', lambda: self.connect_seconds, 'Время создания пула и применения миграций')
+            self.connect_seconds = 0.0
+            self._connect_lock = asyncio.Lock()
+
+    async def connect(self, pool: Optional[asyncpg.Pool] = None) -> None:
+        """
+        Создает пул и применяет миграции. Вызывать заранее не обязательно: пул создается
+        при первом обращении к базе. Пул можно передать снаружи, например, подключенный
+        к локальной тестовой базе.
+        """
+        if Database._pool is not None:
+            return
+        async with self._connect_lock:
+            if Database._pool is not None:
+                return
+            started = time.perf_counter()
             try:
-                Database._pool = SimpleConnectionPool(
-                    minconn=1,
-                    maxconn=10,
-                    dbname=db_dbname,
-                    host=db_host,
-                    user=db_user,
-                    password=db_password
-                )
-                with Database._pool.getconn() as conn:
-                    conn.autocommit = True
-                    with conn.cursor() as cur:
-                        files = [
-                            'sql/users.sql',
-                        ]
-                        for file in files:
-                            with open(file, 'r', encoding='utf-8') as f:
-                                cur.execute(f.read())
-
-            except psycopg2.OperationalError as e:
-                logger.error(f'Error creating db connection pool: {e}')
-
-    @staticmethod
-    def _get_conn():
-        return Database._pool.getconn()
-
-    @staticmethod
-    def _put_conn(conn):
-        Database._pool.putconn(conn)
-
-    @with_db_connection()
-    def get_user(self, conn, tg_id: int) -> Optional[User]:
-        with conn.cursor() as cur:
-            cur.execute('SELECT * FROM get_user(%s);', (tg_id,))
-            user = cur.fetchone()
-            if user:
-                return User(
-                    id=user[0],
-                    tg_id=user[1],
-                    tg_username=user[2],
-                    tg_first_name=user[3],
-                    tg_last_name=user[4],
-                    lichess_username=user[5]
+                if settings.DATABASE_URL:
+                    connect_kwargs = {'dsn': settings.DATABASE_URL}
+                else:
+                    connect_kwargs = {'database': db_dbname, 'host': db_host, 'user': db_user, 'password': db_password}
+                new_pool = pool or await asyncpg.create_pool(
+                    **connect_kwargs,
+                    min_size=settings.DB_POOL_MIN_SIZE,
+                    max_size=settings.DB_POOL_MAX_SIZE,
+                    statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+                    server_settings={'statement_timeout': str(int(settings.DB_STATEMENT_TIMEOUT * 1000))},
                 )
+            except (asyncpg.PostgresError, *DB_ERRORS) as e:
+                logger.error(f'Error creating db connection pool: {e!r}')
+                return
+            pool_created = time.perf_counter()
+            try:
+                async with new_pool.acquire(timeout=settings.DB_ACQUIRE_TIMEOUT) as conn:
+                    applied = await apply_migrations(conn, MIGRATIONS)
+            except (asyncpg.PostgresError, *DB_ERRORS) as e:
+                # Например, уникальный индекс не создается из-за дубликатов в таблице
+                logger.error(f'Error applying db migrations: {e!r}')
+                if new_pool is not pool:
+                    # Иначе каждое следующее обращение к базе создавало бы еще один пул
+                    await new_pool.close()
+                return
+
+            # Пул становится доступен остальным только после миграций
+            Database._pool = new_pool
+            finished = time.perf_counter()
+            self.connect_seconds = finished - started
+            logger.info(
+                f'Database connected in {self.connect_seconds:.3f}s (pool {pool_created - started:.3f}s, '
+                f'migrations {finished - pool_created:.3f}s, applied: {", ".join(applied) or "none"})'
+            )
+
+    async def close(self) -> None:
+        if Database._pool is not None:
+            await Database._pool.close()
+            Database._pool = None
+
+    @contextlib.asynccontextmanager
+    async def _acquire(self):
+        if Database._pool is None:
+            await self.connect()
+            if Database._pool is None:
+                raise asyncpg.InterfaceError('connection pool is not initialized')
+        started = time.perf_counter()
+        async with Database._pool.acquire(timeout=settings.DB_ACQUIRE_TIMEOUT) as conn:
+            self.acquire_wait.observe(time.perf_counter() - started)
+            yield conn
+
+    def pool_stats(self) -> dict:
+        pool = Database._pool
+        return {
+            'size': pool.get_size() if pool else 0,
+            'idle': pool.get_idle_size() if pool else 0,
+            'max_size': pool.get_max_size() if pool else 0,
+            'acquire_count': self.acquire_wait.count,
+            'acquire_wait_mean': self.acquire_wait.mean,
+            'acquire_wait_max': self.acquire_wait.max,
+        }
+
+    async def warm_up_user_cache(self) -> list[User]:
+        users = await self.get_all_users() or []
+        for user in users[:settings.USER_CACHE_MAX_ENTRIES]:
+            self.user_cache.set(user.tg_id, user)
+        logger.info(f'User cache warmed up: {len(self.user_cache)} users')
+        return users
+
+    def _cached_user(self, tg_id: int) -> Optional[User]:
+        user: Optional[User] = self.user_cache.get(tg_id)
+        # Ник мог установить другой процесс бота: пока в кэше его нет, перечитываем пользователя из базы
+        if user is not None and user.lichess_username is None and settings.CONVERSATION_STORE == 'postgres':
             return None
+        return user
+
+    async def get_user(self, tg_id: int) -> Optional[User]:
+        user = self._cached_user(tg_id)
+        if user is None:
+            user = await self._fetch_user(tg_id)
+            if user is not None:
+                self.user_cache.set(tg_id, user)
+        return user
 
     @with_db_connection()
-    def get_all_users(self, conn) -> list[User]:
-        with conn.cursor() as cur:
-            cur.execute('SELECT * FROM get_all_users();')
-            users = cur.fetchall()
-            return [
-                User(
-                    id=user[0],
-                    tg_id=user[1],
-                    tg_username=user[2],
-                    tg_first_name=user[3],
-                    tg_last_name=user[4],
-                    lichess_username=user[5]
-                ) for user in users
-            ]
-
-    @with_db_connection()
-    def add_user(self, conn, tg_id: int, tg_username: str, tg_first_name: str, tg_last_name: str) -> Optional[str]:
-        with conn.cursor() as cur:
-            try:
-                cur.execute(
-                    'SELECT add_user(%s, %s, %s, %s);',
-                    (tg_id, tg_username, tg_first_name, tg_last_name)
+    async def _fetch_user(self, conn, tg_id: int) -> Optional[User]:
+        user = await conn.fetchrow(GET_USER_SQL, tg_id)
+        if user:
+            return User(**dict(user))
+        return None
+
+    async def get_or_create_user(self, tg_id: int, tg_username: str, tg_first_name: str, tg_last_name: str) -> Optional[tuple[User, bool]]:
+        """(пользователь, создан ли он сейчас) за один запрос к базе, а для известных пользователей - без запросов."""
+        user = self._cached_user(tg_id)
+        if user is not None:
+            return user, False
+        result = await self._get_or_create_user(tg_id, tg_username, tg_first_name, tg_last_name)
+        if result is not None:
+            self.user_cache.set(tg_id, result[0])
+        return result
+
+    @with_db_connection()
+    async def _get_or_create_user(self, conn, tg_id: int, tg_username: str, tg_first_name: str, tg_last_name: str) -> Optional[tuple[User, bool]]:
+        row = await conn.fetchrow(GET_OR_CREATE_USER_SQL, tg_id, tg_username, tg_first_name, tg_last_name)
+        if row is None:
+            # Пользователя одновременно добавил другой запрос, и его строка не попала в снимок этого запроса
+            row = await conn.fetchrow(GET_USER_SQL, tg_id)
+            if row is None:
+                return None
+            return User(**dict(row)), False
+        values = dict(row)
+        created = values.pop('created')
+        return User(**values), created
+
+    @with_db_connection()
+    async def get_all_users(self, conn) -> list[User]:
+        users = await conn.fetch('SELECT * FROM get_all_users();')
+        return [User(**dict(user)) for user in users]
+
+    @with_db_connection()
+    async def get_users_page(self, conn, limit: int, after_id: int = 0, before_id: Optional[int] = None) -> tuple[list[User], bool]:
+        """Страница пользователей по возрастанию id (keyset). Второй элемент - есть ли еще записи в направлении листания."""
+        if before_id is None:
+            users = await conn.fetch('SELECT * FROM get_users_after($1, $2);', after_id, limit + 1)
+        else:
+            users = await conn.fetch('SELECT * FROM get_users_before($1, $2);', before_id, limit + 1)
+        has_more = len(users) > limit
+        users = [User(**dict(user)) for user in users[:limit]]
+        if before_id is not None:
+            users.reverse()
+        return users, has_more
+
+    @with_db_connection()
+    async def update_lichess_username(self, conn, tg_id: int, new_lichess_username: str) -> None:
+        await conn.execute(UPDATE_LICHESS_USERNAME_SQL, tg_id, new_lichess_username)
+        user: Optional[User] = self.user_cache.get_stale(tg_id)
+        if user is not None:
+            self.user_cache.set(tg_id, user.model_copy(update={'lichess_username': new_lichess_username}))
+
+    @with_db_connection()
+    async def set_digest_subscription(self, conn, tg_id: int, frequency: Optional[str]) -> None:
+        await conn.execute('SELECT set_digest_subscription($1, $2);', tg_id, frequency)
+
+    @with_db_connection()
+    async def get_digest_recipients(self, conn, frequency: str) -> list[tuple[int, str]]:
+        rows = await conn.fetch('SELECT * FROM get_digest_recipients($1);', frequency)
+        return [(row['tg_id'], row['lichess_username']) for row in rows]
+
+    @with_db_connection()
+    async def get_conversation_state(self, conn, chat_id: int, key: str) -> Optional[str]:
+        return await conn.fetchval(GET_CONVERSATION_STATE_SQL, chat_id, key)
+
+    @with_db_connection()
+    async def set_conversation_state(self, conn, chat_id: int, key: str, value: str = '1', ttl: Optional[float] = None) -> None:
+        await conn.execute(SET_CONVERSATION_STATE_SQL, chat_id, key, value, ttl)
+
+    @with_db_connection()
+    async def delete_conversation_state(self, conn, chat_id: int, key: str) -> bool:
+        return await conn.fetchval(DELETE_CONVERSATION_STATE_SQL, chat_id, key) is not None
+
+    @with_db_connection()
+    async def purge_conversation_state(self, conn) -> int:
+        return await conn.fetchval('SELECT purge_conversation_state();')
+
+    @with_db_connection()
+    async def get_lichess_usernames(self, conn) -> list[str]:
+        return [row['lichess_username'] for row in await conn.fetch(GET_LICHESS_USERNAMES_SQL)]
+
+    @with_db_connection()
+    async def store_ratings(self, conn, day: date, ratings: list[tuple[str, GameType, int, int, bool]]) -> bool:
+        """ratings - (ник на Lichess, вид игр, рейтинг, число партий, предварительный ли рейтинг)."""
+        lichess_ids = [lichess_username.lower() for lichess_username, *_ in ratings]
+        game_types = [game_type.value for _, game_type, *_ in ratings]
+        rating_values = [rating for _, _, rating, _, _ in ratings]
+        async with conn.transaction():
+            await conn.execute(STORE_RATING_HISTORY_SQL, day, lichess_ids, game_types, rating_values)
+            await conn.execute(
+                STORE_RATINGS_SQL, day, lichess_ids, game_types,
+                [lichess_username for lichess_username, *_ in ratings],
+                rating_values,
+                [games for _, _, _, games, _ in ratings],
+                [provisional for *_, provisional in ratings],
+            )
+        return True
+
+    @with_db_connection()
+    async def purge_ratings(self, conn, day: date) -> int:
+        return await conn.fetchval('SELECT purge_ratings($1);', day)
+
+    @with_db_connection()
+    async def get_leaderboard(self, conn, game_types: list[GameType], limit: int, by_week_change: bool = False) -> list[tuple[GameType, str, int, int]]:
+        """(вид игр, ник, рейтинг, изменение за неделю) - лучшие limit игроков по каждому виду в порядке game_types."""
+        rows = await conn.fetch(
+            LEADERBOARD_BY_WEEK_CHANGE_SQL if by_week_change else LEADERBOARD_BY_RATING_SQL,
+            [game_type.value for game_type in game_types], limit,
+        )
+        return [(GameType(row['game_type']), row['lichess_username'], row['rating'], row['week_change']) for row in rows]
+
+    @with_db_connection()
+    async def get_last_activity_day(self, conn, lichess_username: str) -> Optional[date]:
+        return await conn.fetchval('SELECT get_last_activity_day($1);', lichess_username.lower())
+
+    @with_db_connection()
+    async def upsert_activity_days(self, conn, lichess_username: str, activities: list) -> bool:
+        """Перезаписывает переданные дни целиком. Принимает модели из schemas.py или fast_schemas.py."""
+        lichess_username = lichess_username.lower()
+        days, games, puzzles, correspondence, correspondence_games = [], [], [], [], []
+        for activity in activities:
+            day = activity.date
+            days.append((lichess_username, day))
+            for position, game in enumerate(activity.games or []):
+                games.append((
+                    lichess_username, day, game.type.value, position, game.wins, game.losses, game.draws,
+                    game.rating_before, game.rating_after,
+                ))
+            if activity.puzzles:
+                p = activity.puzzles
+                puzzles.append((lichess_username, day, p.wins, p.losses, p.rating_before, p.rating_after))
+            if activity.correspondence_moves:
+                moves = activity.correspondence_moves
+                correspondence.append((lichess_username, day, 'moves', moves.total_moves, None, None, None, None, None))
+                correspondence_games.extend(
+                    (lichess_username, day, 'moves', position, g.id_, g.color.value, g.url, g.opponent_username, g.opponent_rating)
+                    for position, g in enumerate(moves.games)
+                )
+            if activity.correspondence_ends:
+                ends = activity.correspondence_ends
+                correspondence.append((
+                    lichess_username, day, 'ends', None, ends.wins, ends.losses, ends.draws,
+                    ends.rating_before, ends.rating_after,
+                ))
+                correspondence_games.extend(
+                    (lichess_username, day, 'ends', position, g.id_, g.color.value, g.url, g.opponent_username, g.opponent_rating)
+                    for position, g in enumerate(ends.games)
                 )
-            except Exception as e:
-                return str(e)
+
+        # Одного игрока могут одновременно обновлять несколько процессов бота: строки, вставленные
+        # параллельной транзакцией, DELETE не видит, поэтому вставки идут через ON CONFLICT
+        async with conn.transaction():
+            await conn.execute(
+                'DELETE FROM activity_days WHERE lichess_username = $1 AND day = ANY($2::date[]);',
+                lichess_username, [day for _, day in days],
+            )
+            await conn.executemany('INSERT INTO activity_days (lichess_username, day) VALUES ($1, $2) '
+                'ON CONFLICT (lichess_username, day) DO UPDATE SET updated_at = now();', days)
+            await conn.executemany(
+                'INSERT INTO activity_games (lichess_username, day, game_type, position, wins, losses, draws, rating_before, rating_after) '
+                'VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) '
+                'ON CONFLICT (lichess_username, day, game_type) DO UPDATE SET position = EXCLUDED.position, '
+                'wins = EXCLUDED.wins, losses = EXCLUDED.losses, draws = EXCLUDED.draws, '
+                'rating_before = EXCLUDED.rating_before, rating_after = EXCLUDED.rating_after;',
+                games,
+            )
+            await conn.executemany(
+                'INSERT INTO activity_puzzles (lichess_username, day, wins, losses, rating_before, rating_after) '
+                'VALUES ($1, $2, $3, $4, $5, $6) '
+                'ON CONFLICT (lichess_username, day) DO UPDATE SET wins = EXCLUDED.wins, losses = EXCLUDED.losses, '
+                'rating_before = EXCLUDED.rating_before, rating_after = EXCLUDED.rating_after;',
+                puzzles,
+            )
+            await conn.executemany(
+                'INSERT INTO activity_correspondence (lichess_username, day, kind, total_moves, wins, losses, draws, rating_before, rating_after) '
+                'VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) '
+                'ON CONFLICT (lichess_username, day, kind) DO UPDATE SET total_moves = EXCLUDED.total_moves, '
+                'wins = EXCLUDED.wins, losses = EXCLUDED.losses, draws = EXCLUDED.draws, '
+                'rating_before = EXCLUDED.rating_before, rating_after = EXCLUDED.rating_after;',
+                correspondence,
+            )
+            await conn.executemany(
+                'INSERT INTO activity_correspondence_games '
+                '(lichess_username, day, kind, position, game_id, color, url, opponent_username, opponent_rating) '
+                'VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) '
+                'ON CONFLICT (lichess_username, day, kind, position) DO UPDATE SET game_id = EXCLUDED.game_id, '
+                'color = EXCLUDED.color, url = EXCLUDED.url, opponent_username = EXCLUDED.opponent_username, '
+                'opponent_rating = EXCLUDED.opponent_rating;',
+                correspondence_games,
+            )
+        return True
 
     @with_db_connection()
-    def update_lichess_username(self, conn, tg_id: int, new_lichess_username: str) -> None:
-        with conn.cursor() as cur:
-            cur.execute(
-                'SELECT update_lichess_username(%s, %s);',
-                (tg_id, new_lichess_username)
-            )
\ No newline at end of file
+    async def get_activity_days(self, conn, lichess_username: str, since: date, until: Optional[date] = None) -> list[fast_schemas.Activity]:
+        """Дни с since включительно по until не включительно (без until - по последний сохраненный)."""
+        lichess_username = lichess_username.lower()
+        activities: dict[date, fast_schemas.Activity] = {}
+        for row in await conn.fetch(
+            'SELECT day FROM activity_days WHERE lichess_username = $1 AND day >= $2 AND ($3::date IS NULL OR day < $3) ORDER BY day DESC;',
+            lichess_username, since, until,
+        ):
+            activities[row['day']] = fast_schemas.Activity(row['day'])
+
+        for row in await conn.fetch(
+            'SELECT day, game_type, wins, losses, draws, rating_before, rating_after FROM activity_games '
+            'WHERE lichess_username = $1 AND day >= $2 AND ($3::date IS NULL OR day < $3) ORDER BY day, position;',
+            lichess_username, since, until,
+        ):
+            activity = activities[row['day']]
+            if activity.games is None:
+                activity.games = []
+            activity.games.append(fast_schemas.Game(
+                GameType(row['game_type']), row['wins'], row['losses'], row['draws'], row['rating_before'], row['rating_after']
+            ))
+
+        for row in await conn.fetch(
+            'SELECT day, wins, losses, rating_before, rating_after FROM activity_puzzles '
+            'WHERE lichess_username = $1 AND day >= $2 AND ($3::date IS NULL OR day < $3);',
+            lichess_username, since, until,
+        ):
+            activities[row['day']].puzzles = fast_schemas.Puzzles(row['wins'], row['losses'], row['rating_before'], row['rating_after'])
+
+        correspondence_games: dict[tuple[date, str], list[fast_schemas.CorrespondenceGame]] = {}
+        for row in await conn.fetch(
+            'SELECT day, kind, game_id, color, url, opponent_username, opponent_rating FROM activity_correspondence_games '
+            'WHERE lichess_username = $1 AND day >= $2 AND ($3::date IS NULL OR day < $3) ORDER BY day, kind, position;',
+            lichess_username, since, until,
+        ):
+            correspondence_games.setdefault((row['day'], row['kind']), []).append(fast_schemas.CorrespondenceGame(
+                row['game_id'], Color(row['color']), row['url'], row['opponent_username'], row['opponent_rating']
+            ))
+
+        for row in await conn.fetch(
+            'SELECT day, kind, total_moves, wins, losses, draws, rating_before, rating_after FROM activity_correspondence '
+            'WHERE lichess_username = $1 AND day >= $2 AND ($3::date IS NULL OR day < $3);',
+            lichess_username, since, until,
+        ):
+            games = correspondence_games.get((row['day'], row['kind']), [])
+            if row['kind'] == 'moves':
+                activities[row['day']].correspondence_moves = fast_schemas.CorrespondenceMoves(row['total_moves'], games)
+            else:
+                activities[row['day']].correspondence_ends = fast_schemas.CorrespondenceEnds(
+                    row['wins'], row['losses'], row['draws'], row['rating_before'], row['rating_after'], games
+                )
+
+        return list(activities.values())
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from datetime import datetime, time
+
+from telegram.error import Forbidden, TelegramError
+from telegram.ext import Application, ContextTypes
+
+import settings
+from database import Database
+from lichess import get_lichess_activity_message
+from logging_config import set_log_context
+from render import Template
+from scheduler import Priority, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+FREQUENCIES = (DAILY, WEEKLY)
+
+DIGEST_TITLES = {
+    DAILY: Template('*Ежедневная сводка*\n\n'),
+    WEEKLY: Template('*Еженедельная сводка*\n\n'),
+}
+
+# Рассылку начинаем равномерно в первые 80% окна, остаток - запас на медленные ответы
+SPREAD_FRACTION = 0.8
+
+
+def schedule_digests(app: Application) -> None:
+    hours, minutes = map(int, settings.DIGEST_TIME.split(':'))
+    at = time(hour=hours, minute=minutes)
+    app.job_queue.run_daily(send_digests, time=at, data=DAILY, name='digest_daily')
+    app.job_queue.run_daily(send_digests, time=at, days=(settings.DIGEST_WEEKLY_DAY,), data=WEEKLY, name='digest_weekly')
+
+
+async def send_digests(context: ContextTypes.DEFAULT_TYPE) -> None:
+    frequency: str = context.job.data
+    set_log_context(job=context.job.name)
+    recipients = await Database().get_digest_recipients(frequency)
+    if not recipients:
+        return
+
+    # Один и тот же игрок может быть у нескольких пользователей - запрашиваем его один раз
+    players: dict[str, tuple[str, list[int]]] = {}
+    for tg_id, lichess_username in recipients:
+        players.setdefault(lichess_username.lower(), (lichess_username, []))[1].append(tg_id)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + settings.DIGEST_WINDOW
+    step = settings.DIGEST_WINDOW * SPREAD_FRACTION / len(players)
+    lichess_slots = asyncio.Semaphore(settings.DIGEST_LICHESS_CONCURRENCY)
+    send_bucket = TokenBucket(settings.DIGEST_SEND_RATE, settings.DIGEST_SEND_RATE)
+    title = DIGEST_TITLES[frequency].render()
+    stats = {'sent': 0, 'failed': 0}
+
+    async def deliver(no: int, lichess_username: str, chat_ids: list[int]) -> None:
+        await asyncio.sleep(max(started + no * step - loop.time(), 0))
+        handled = 0  # скольким чатам сводка уже отправлена или не отправилась с известной ошибкой
+        try:
+            async with lichess_slots:
+                if loop.time() >= deadline:
+                    return
+                msg = await get_lichess_activity_message(lichess_username, Priority.BACKGROUND)
+            if msg is None:
+                stats['failed'] += len(chat_ids)
+                return
+
+            for chat_id in chat_ids:
+                if loop.time() >= deadline:
+                    return
+                await send_bucket.acquire()
+                try:
+                    await context.bot.send_message(chat_id, title + msg, parse_mode='markdownV2')
+                    stats['sent'] += 1
+                except Forbidden:
+                    # Пользователь заблокировал бота - больше ему не пишем
+                    await Database().set_digest_subscription(chat_id, None)
+                    stats['failed'] += 1
+                except TelegramError as e:
+                    logger.warning(f'Не удалось отправить сводку в чат {chat_id}: {e}')
+                    stats['failed'] += 1
+                handled += 1
+        except Exception:
+            # Иначе исключение осталось бы в задаче непрочитанным, а чаты - ни в отправленных, ни в ошибках
+            logger.exception(f'Ошибка при рассылке сводки по игроку {lichess_username}')
+            stats['failed'] += len(chat_ids) - handled
+
+    tasks = [
+        asyncio.create_task(deliver(no, lichess_username, chat_ids))
+        for no, (lichess_username, chat_ids) in enumerate(players.values())
+    ]
+    _, pending = await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    skipped = len(recipients) - stats['sent'] - stats['failed']
+
+    logger.info(
+        f'Сводки ({frequency}) за {datetime.now():%d.%m.%Y}: игроков {len(players)}, '
+        f'отправлено {stats["sent"]}, ошибок {stats["failed"]}, не успели {skipped}'
+    )
@@ -0,0 +1,214 @@
+"""
+Быстрый разбор ответа /api/user/{username}/activity без pydantic.
+
+Структуры повторяют модели из schemas.py (те же поля и свойства), поэтому агрегация
+(aggregate.py) и формирование сообщения работают с обоими вариантами одинаково.
+Из этих же структур собирается итоговая GeneralActivity.
+"""
+import json
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+from schemas import Color, GameType
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+ACTIVITY_FIELDS = frozenset({
+    'interval', 'games', 'puzzles', 'tournaments', 'follows', 'teams', 'correspondenceMoves', 'correspondenceEnds',
+})
+CORRESPONDENCE_GAME_FIELDS = frozenset({'id', 'color', 'url', 'opponent'})
+CORRESPONDENCE_MOVES_FIELDS = frozenset({'nb', 'games'})
+CORRESPONDENCE_ENDS_FIELDS = frozenset({'correspondence'})
+
+
+def _check_fields(values: dict, allowed: frozenset, name: str) -> None:
+    extra = values.keys() - allowed
+    if extra:
+        raise ValueError(f'{name}: extra fields not permitted: {", ".join(sorted(extra))}')
+
+
+@dataclass(slots=True)
+class Game:
+    type: GameType
+    wins: int
+    losses: int
+    draws: int
+    rating_before: int
+    rating_after: int
+
+    @classmethod
+    def decode(cls, game_type: str, values: dict) -> 'Game':
+        rp = values['rp']
+        return cls(GameType(game_type), values['win'], values['loss'], values['draw'], rp['before'], rp['after'])
+
+    @property
+    def matches(self) -> int:
+        return self.wins + self.losses + self.draws
+
+
+@dataclass(slots=True)
+class Puzzles:
+    wins: int
+    losses: int
+    rating_before: int
+    rating_after: int
+
+    @classmethod
+    def decode(cls, values: dict) -> 'Puzzles':
+        score = values['score']
+        if score['draw'] != 0:
+            raise ValueError('Puzzles: draw must be 0')
+        return cls(score['win'], score['loss'], score['rp']['before'], score['rp']['after'])
+
+
+@dataclass(slots=True)
+class CorrespondenceGame:
+    id_: str
+    color: Color
+    url: str
+    opponent_username: str
+    opponent_rating: int
+
+    @classmethod
+    def decode(cls, values: dict, strict: bool) -> 'CorrespondenceGame':
+        if strict:
+            _check_fields(values, CORRESPONDENCE_GAME_FIELDS, 'CorrespondenceGame')
+        color = values['color']
+        if color not in ('white', 'black'):
+            raise ValueError(f'CorrespondenceGame: unknown color {color!r}')
+        opponent = values['opponent']
+        return cls(
+            values['id'],
+            Color.WHITE if color == 'white' else Color.BLACK,
+            values['url'],
+            opponent['user'],
+            opponent['rating'],
+        )
+
+
+@dataclass(slots=True)
+class CorrespondenceMoves:
+    total_moves: int
+    games: list[CorrespondenceGame]
+
+    @classmethod
+    def decode(cls, values: dict, strict: bool) -> 'CorrespondenceMoves':
+        if strict:
+            _check_fields(values, CORRESPONDENCE_MOVES_FIELDS, 'CorrespondenceMoves')
+        return cls(values['nb'], [CorrespondenceGame.decode(game, strict) for game in values['games']])
+
+    @property
+    def opponent_ratings(self) -> list[tuple[str, int]]:
+        return [(game.opponent_username, game.opponent_rating,) for game in self.games]
+
+
+@dataclass(slots=True)
+class CorrespondenceEnds:
+    wins: int
+    losses: int
+    draws: int
+    rating_before: int
+    rating_after: int
+    games: list[CorrespondenceGame]
+
+    @classmethod
+    def decode(cls, values: dict, strict: bool) -> 'CorrespondenceEnds':
+        if strict:
+            _check_fields(values, CORRESPONDENCE_ENDS_FIELDS, 'CorrespondenceEnds')
+        correspondence = values['correspondence']
+        score = correspondence['score']
+        return cls(
+            score['win'],
+            score['loss'],
+            score['draw'],
+            score['rp']['before'],
+            score['rp']['after'],
+            [CorrespondenceGame.decode(game, strict) for game in correspondence['games']],
+        )
+
+    @property
+    def opponent_ratings(self) -> list[tuple[str, int]]:
+        return [(game.opponent_username, game.opponent_rating,) for game in self.games]
+
+    @property
+    def matches(self) -> int:
+        return self.wins + self.losses + self.draws
+
+
+def activity_date(values: dict) -> date:
+    return datetime.fromtimestamp(values['interval']['start'] / 1000).date()
+
+
+@dataclass(slots=True)
+class Activity:
+    date: date
+    games: Optional[list[Game]] = None
+    puzzles: Optional[Puzzles] = None
+    correspondence_moves: Optional[CorrespondenceMoves] = None
+    correspondence_ends: Optional[CorrespondenceEnds] = None
+    # Турниры, подписки и команды в сообщении не используются, поэтому остаются как есть
+    tournaments: Optional[list[dict]] = None
+    follows: Optional[dict] = None
+    teams: Optional[list[dict]] = None
+
+    @classmethod
+    def decode(cls, values: dict, strict: bool = True) -> 'Activity':
+        if strict:
+            _check_fields(values, ACTIVITY_FIELDS, 'Activity')
+        activity = cls(activity_date(values))
+        if 'games' in values:
+            activity.games = [Game.decode(game_type, game_data) for game_type, game_data in values['games'].items()]
+        if 'puzzles' in values:
+            activity.puzzles = Puzzles.decode(values['puzzles'])
+        if 'correspondenceMoves' in values:
+            activity.correspondence_moves = CorrespondenceMoves.decode(values['correspondenceMoves'], strict)
+        if 'correspondenceEnds' in values:
+            activity.correspondence_ends = CorrespondenceEnds.decode(values['correspondenceEnds'], strict)
+        if 'tournaments' in values:
+            activity.tournaments = values['tournaments']['best']
+        activity.follows = values.get('follows')
+        activity.teams = values.get('teams')
+        return activity
+
+
+def decode_activities(body: bytes, strict: bool = True) -> list[Activity]:
+    return [Activity.decode(activity, strict) for activity in loads(body)]
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_activity_items(body: bytes):
+    """
+    Дни из JSON-массива по одному: каждый следующий разбирается только когда нужен,
+    поэтому весь ответ не превращается в список словарей целиком.
+    """
+    text = body.decode()
+    position = _WHITESPACE.match(text, 0).end()
+    if text[position:position + 1] != '[':
+        raise ValueError('Activity response must be a JSON array')
+    position = _WHITESPACE.match(text, position + 1).end()
+    if text[position:position + 1] == ']':
+        return
+    while True:
+        item, position = _decoder.raw_decode(text, position)
+        yield item
+        position = _WHITESPACE.match(text, position).end()
+        separator = text[position:position + 1]
+        position = _WHITESPACE.match(text, position + 1).end()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Unexpected {separator!r} in activity response at {position}')
+
+
+def iter_activities(body: bytes, strict: bool = True):
+    for activity in iter_activity_items(body):
+        yield Activity.decode(activity, strict)
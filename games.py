@@ -0,0 +1,280 @@
+"""
+Сводка по последним партиям игрока (/games): дебюты, результаты за белых и черных,
+средний рейтинг соперников.
+
+Партии берутся из выгрузки GET /api/games/user/{username}, которую Lichess отдает потоком
+NDJSON (одна партия - одна строка). Строки разбираются по мере получения и сразу добавляются
+в сводку, сами партии не накапливаются: память не зависит от числа партий у игрока, а чтение
+прекращается, как только набрано нужное количество.
+"""
+import contextlib
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from enum import StrEnum
+from typing import AsyncIterable, AsyncIterator, Optional
+
+import httpx
+
+import settings
+from fast_schemas import loads
+from lichess_client import LichessClient
+from render import MessageBuilder, Template
+from scheduler import Priority
+from schemas import Color, GameType, human_type
+from utils import prettify_interval
+
+logger = logging.getLogger(__name__)
+
+# Без ходов, часов и оценок строка партии занимает несколько сотен байт
+EXPORT_PARAMS = {'moves': 'false', 'clocks': 'false', 'evals': 'false', 'opening': 'true', 'finished': 'true'}
+# Несостоявшиеся партии в сводку не попадают
+SKIPPED_STATUSES = frozenset({'created', 'started', 'aborted', 'noStart', 'unknownFinish'})
+GAME_TYPES = {game_type.value.lower(): game_type for game_type in GameType}
+
+COLOR_TITLES = {Color.WHITE: 'Белыми', Color.BLACK: 'Черными'}
+
+NO_GAMES_TEMPLATE = Template('У *{username}* нет сыгранных партий на Lichess')
+TITLE_TEMPLATE = Template('*Последние партии {username} на Lichess \\({interval}\\)*')
+TYPE_TITLE_TEMPLATE = Template('*Последние партии {username} на Lichess: {type} \\({interval}\\)*')
+TOTAL_TEMPLATE = Template('\n\nПартий: {games}')
+OPPONENTS_TEMPLATE = Template('\nСредний рейтинг соперников: {rating}')
+COLOR_TEMPLATE = Template('\n\n  __{color}__\n    Партий: {matches}\n    Побед: {wins}\n    Поражений: {losses}\n    Ничьих: {draws}')
+OPENINGS_TEMPLATE = Template('\n\n  __Дебюты__')
+OPENING_TEMPLATE = Template('\n    {name} — {matches} \\(\\+{wins} −{losses} \\={draws}\\)')
+USAGE_TEMPLATE = Template(
+    'Сводка по последним партиям на Lichess:\n'
+    '/games — последние {default} партий\n'
+    '/games 100 — последние 100 партий \\(не больше {max}\\)\n'
+    '/games 100 blitz — только партии одного вида'
+)
+
+
+class GameResult(StrEnum):
+    WIN = 'win'
+    LOSS = 'loss'
+    DRAW = 'draw'
+
+
+@dataclass(slots=True)
+class ExportedGame:
+    """Партия из выгрузки с точки зрения игрока, чьи партии выгружаются."""
+    id_: str
+    type: Optional[GameType]  # None - вид, которого нет в GameType (например, игра с позиции)
+    rated: bool
+    played_on: date
+    color: Color
+    result: GameResult
+    opponent_username: Optional[str]  # None - игра с компьютером
+    opponent_rating: Optional[int]
+    opening: Optional[str]
+
+    @classmethod
+    def decode(cls, values: dict, lichess_id: str) -> Optional['ExportedGame']:
+        """None - если партия не состоялась или игрока в ней нет."""
+        if values.get('status') in SKIPPED_STATUSES:
+            return None
+        players = values['players']
+        white_user = players['white'].get('user')
+        if white_user is not None and white_user['id'] == lichess_id:
+            color, opponent = Color.WHITE, players['black']
+        else:
+            black_user = players['black'].get('user')
+            if black_user is None or black_user['id'] != lichess_id:
+                return None
+            color, opponent = Color.BLACK, players['white']
+
+        winner = values.get('winner')
+        if winner is None:
+            result = GameResult.DRAW
+        elif (winner == 'white') == (color is Color.WHITE):
+            result = GameResult.WIN
+        else:
+            result = GameResult.LOSS
+
+        opponent_user = opponent.get('user')
+        opening = values.get('opening')
+        return cls(
+            values['id'],
+            GAME_TYPES.get(values.get('perf', '').lower()),
+            values.get('rated', False),
+            datetime.fromtimestamp(values['createdAt'] / 1000).date(),
+            color,
+            result,
+            opponent_user['name'] if opponent_user is not None else None,
+            opponent.get('rating') if opponent_user is not None else None,
+            opening['name'] if opening else None,
+        )
+
+
+@dataclass(slots=True)
+class Results:
+    wins: int = 0
+    losses: int = 0
+    draws: int = 0
+
+    def add(self, result: GameResult) -> None:
+        if result is GameResult.WIN:
+            self.wins += 1
+        elif result is GameResult.LOSS:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def matches(self) -> int:
+        return self.wins + self.losses + self.draws
+
+
+@dataclass(slots=True)
+class GamesSummary:
+    games: int = 0
+    white: Results = field(default_factory=Results)
+    black: Results = field(default_factory=Results)
+    openings: dict[str, Results] = field(default_factory=dict)
+    opponent_rating_total: int = 0
+    rated_opponents: int = 0
+    from_date: Optional[date] = None
+    to_date: Optional[date] = None
+
+    def add(self, game: ExportedGame) -> None:
+        self.games += 1
+        (self.white if game.color is Color.WHITE else self.black).add(game.result)
+        if game.opening:
+            # Варианты ("Sicilian Defense: Najdorf Variation") объединяем в один дебют
+            name = game.opening.partition(':')[0]
+            results = self.openings.get(name)
+            if results is None:
+                results = self.openings[name] = Results()
+            results.add(game.result)
+        if game.opponent_rating is not None:
+            self.opponent_rating_total += game.opponent_rating
+            self.rated_opponents += 1
+        if self.from_date is None or game.played_on < self.from_date:
+            self.from_date = game.played_on
+        if self.to_date is None or game.played_on > self.to_date:
+            self.to_date = game.played_on
+
+    @property
+    def average_opponent_rating(self) -> Optional[int]:
+        if not self.rated_opponents:
+            return None
+        return round(self.opponent_rating_total / self.rated_opponents)
+
+    def top_openings(self, limit: int) -> list[tuple[str, Results]]:
+        counts = Counter({name: results.matches for name, results in self.openings.items()})
+        return [(name, self.openings[name]) for name, _ in counts.most_common(limit)]
+
+
+async def iter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+    """Объекты из потока NDJSON по мере поступления строк. В памяти - только недочитанная строка."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b'\n', start)) != -1:
+            # Пустые строки Lichess присылает, чтобы соединение не закрылось, пока партии ищутся
+            if end > start:
+                yield loads(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+    if buffer.strip():
+        yield loads(buffer)
+
+
+async def iter_exported_games(chunks: AsyncIterable[bytes], username: str) -> AsyncIterator[ExportedGame]:
+    lichess_id = username.lower()
+    async with contextlib.aclosing(iter_ndjson(chunks)) as items:
+        async for values in items:
+            game = ExportedGame.decode(values, lichess_id)
+            if game is not None:
+                yield game
+
+
+async def get_games_summary(
+    username: str,
+    limit: int,
+    game_type: Optional[GameType] = None,
+    priority: Priority = Priority.INTERACTIVE,
+) -> Optional[GamesSummary]:
+    params = {**EXPORT_PARAMS, 'max': limit}
+    if game_type is not None:
+        params['perfType'] = game_type.value
+    summary = GamesSummary()
+    try:
+        async with LichessClient().stream(
+            f'/api/games/user/{username}', params=params, headers={'Accept': 'application/x-ndjson'}, priority=priority
+        ) as response:
+            if response.status_code != 200:
+                logger.error(f'Ошибка при выгрузке партий пользователя {username} с Lichess: {response.status_code} - {response.text}')
+                return None
+            async with contextlib.aclosing(iter_exported_games(response.aiter_bytes(), username)) as games:
+                async for game in games:
+                    summary.add(game)
+                    if summary.games >= limit:
+                        break
+    except httpx.HTTPError as e:
+        logger.error(f'Ошибка соединения при выгрузке партий пользователя {username} с Lichess: {e!r}')
+        return None
+    except (ValueError, KeyError) as e:
+        logger.error(f'Не удалось разобрать партии пользователя {username} с Lichess: {e!r}')
+        return None
+    return summary
+
+
+def render_games_summary(username: str, summary: GamesSummary, game_type: Optional[GameType] = None) -> str:
+    if not summary.games:
+        return NO_GAMES_TEMPLATE.render(username=username)
+
+    interval = prettify_interval(summary.from_date, summary.to_date)
+    if game_type is None:
+        builder = MessageBuilder().add(TITLE_TEMPLATE, username=username, interval=interval)
+    else:
+        builder = MessageBuilder().add(TYPE_TITLE_TEMPLATE, username=username, type=human_type(game_type), interval=interval)
+    builder.add(TOTAL_TEMPLATE, games=summary.games)
+    if summary.average_opponent_rating is not None:
+        builder.add(OPPONENTS_TEMPLATE, rating=summary.average_opponent_rating)
+
+    for color, results in ((Color.WHITE, summary.white), (Color.BLACK, summary.black)):
+        if results.matches:
+            builder.add(
+                COLOR_TEMPLATE,
+                color=COLOR_TITLES[color],
+                matches=results.matches,
+                wins=results.wins,
+                losses=results.losses,
+                draws=results.draws,
+            )
+
+    openings = summary.top_openings(settings.GAMES_SUMMARY_OPENINGS)
+    if openings:
+        builder.add(OPENINGS_TEMPLATE)
+        for name, results in openings:
+            builder.add(OPENING_TEMPLATE, name=name, matches=results.matches, wins=results.wins, losses=results.losses, draws=results.draws)
+    return builder.build()
+
+
+def usage() -> str:
+    return USAGE_TEMPLATE.render(default=settings.GAMES_SUMMARY_DEFAULT, max=settings.GAMES_SUMMARY_MAX)
+
+
+def parse_games_args(args: list[str]) -> Optional[tuple[int, Optional[GameType]]]:
+    """(сколько партий, вид игр) из аргументов команды; None - если аргументы не разобрать."""
+    limit = settings.GAMES_SUMMARY_DEFAULT
+    game_type = None
+    for arg in args:
+        if arg.isdigit() and 0 < int(arg) <= settings.GAMES_SUMMARY_MAX:
+            limit = int(arg)
+        elif arg.lower() in GAME_TYPES:
+            game_type = GAME_TYPES[arg.lower()]
+        else:
+            return None
+    return limit, game_type
+
+
+async def get_games_message(username: str, limit: int, game_type: Optional[GameType] = None) -> Optional[str]:
+    summary = await get_games_summary(username, limit, game_type)
+    if summary is None:
+        return None
+    return render_games_summary(username, summary, game_type)
@@ -1,7 +1,17 @@
+import argparse
+import hashlib
+import json
 import os
+import posixpath
+import shutil
+import stat
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-from fabric import Connection, Result
+import paramiko
+from fabric import Connection
 from colorama import init as colorama_init
 import humanize
 
@@ -9,6 +19,11 @@ from data import HOST, USER, PRIVATE_KEY_PATH, SERVER_WD
 
 LOGS_FOLDER = 'logs'
 SUBFOLDER_INDENT = ' ' * 4
+LOG_NAME = 'info.log'  # вместе с ротированными info.log.1, info.log.2026-01-01 и т.д.
+STATE_FILE = '.sync_state.json'
+# По хвосту такого размера проверяем, что уже скачанная часть файла на сервере не изменилась
+CHECKSUM_WINDOW = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
 
 
 class Colors:
@@ -22,48 +37,225 @@ class Colors:
 
 
 class SFTPConnection:
-    def __init__(self):
-        self.conn = Connection(host=HOST, user=USER, connect_kwargs={'key_filename': PRIVATE_KEY_PATH})
+    """
+    Одна SSH-сессия со сжатием (zlib на стороне сервера), поверх которой каждый поток
+    открывает свой SFTP-канал - так файлы качаются параллельно без лишних рукопожатий.
+    """
+
+    def __init__(self, host: str = HOST, user: str = USER, port: int = 22, key_filename: str = PRIVATE_KEY_PATH):
+        self.conn = Connection(
+            host=host, user=user, port=port, connect_kwargs={'key_filename': key_filename, 'compress': True}
+        )
+        self._local = threading.local()
+        self._clients: list[paramiko.SFTPClient] = []
+        self._lock = threading.Lock()
+
+    @property
+    def sftp(self) -> paramiko.SFTPClient:
+        client = getattr(self._local, 'sftp', None)
+        if client is None:
+            with self._lock:
+                self.conn.open()
+                client = paramiko.SFTPClient.from_transport(self.conn.transport)
+                self._clients.append(client)
+            self._local.sftp = client
+        return client
 
     def folder_exists(self, folder_path: str) -> bool:
-        result: Result = self.conn.run(f'test -d "{folder_path}"', hide=True, warn=True)
-        return result.ok
+        try:
+            return stat.S_ISDIR(self.sftp.stat(folder_path).st_mode)
+        except FileNotFoundError:
+            return False
 
     is_folder: callable = folder_exists
 
     def get_folder_items(self, remote_path: str):
-        result: Result = self.conn.run(f'find "{remote_path}" -maxdepth 1 -print', hide=True, encoding='utf-8')
-        if not result:
-            raise Exception(f'Failed to get folder objects: {remote_path}. Error: {result.stderr}')
-        files_and_dirs = result.stdout.strip().split('\n')
-        return sorted([item for item in files_and_dirs if item and item != remote_path])
+        return sorted(posixpath.join(remote_path, name) for name in self.sftp.listdir(remote_path))
+
+    def list_files(self, remote_path: str) -> dict[str, tuple[int, int]]:
+        """Имя -> (размер, время изменения) для обычных файлов в папке."""
+        return {
+            attr.filename: (attr.st_size, attr.st_mtime)
+            for attr in self.sftp.listdir_attr(remote_path)
+            if stat.S_ISREG(attr.st_mode)
+        }
+
+    def read_range(self, remote_path: str, offset: int, length: int) -> bytes:
+        with self.sftp.open(remote_path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def copy_range(self, remote_path: str, offset: int, local_file) -> int:
+        copied = 0
+        with self.sftp.open(remote_path, 'rb') as f:
+            f.seek(offset)
+            f.prefetch()
+            while chunk := f.read(CHUNK_SIZE):
+                local_file.write(chunk)
+                copied += len(chunk)
+        return copied
 
     def get(self, remote_path: str, local_path: str) -> None:
-        result: Result = self.conn.get(remote_path, local_path)
-        if not result:
-            raise Exception(f'Failed to download file: {remote_path}. Error: {result.stderr}')
+        self.sftp.get(remote_path, local_path)
 
     def close(self):
+        for client in self._clients:
+            client.close()
         self.conn.close()
 
 
+def tail_checksum(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def local_tail_checksum(path: str, size: int) -> str:
+    with open(path, 'rb') as f:
+        f.seek(max(size - CHECKSUM_WINDOW, 0))
+        return tail_checksum(f.read(min(size, CHECKSUM_WINDOW)))
+
+
+def remote_tail_checksum(sftp: SFTPConnection, remote_path: str, size: int) -> str:
+    start = max(size - CHECKSUM_WINDOW, 0)
+    return tail_checksum(sftp.read_range(remote_path, start, size - start))
+
+
+def load_state(folder: str) -> dict:
+    try:
+        with open(os.path.join(folder, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(folder: str, state: dict) -> None:
+    path = os.path.join(folder, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def find_base(sftp: SFTPConnection, folder: str, remote_path: str, name: str, size: int, state: dict) -> Optional[tuple[str, int]]:
+    """
+    Локальный файл, который совпадает с началом удаленного: сам этот файл до дозаписи или,
+    после ротации, файл под старым именем (info.log -> info.log.1). Возвращает (имя, размер).
+    """
+    candidates = [name] if name in state else []
+    candidates += sorted((other for other in state if other != name), key=lambda other: other != LOG_NAME)
+    for candidate in candidates:
+        known = state[candidate]
+        local_path = os.path.join(folder, candidate)
+        if not 0 < known['size'] <= size or not os.path.isfile(local_path) or os.path.getsize(local_path) != known['size']:
+            continue
+        if remote_tail_checksum(sftp, remote_path, known['size']) == known['checksum']:
+            return candidate, known['size']
+    return None
+
+
+def plan_sync(sftp: SFTPConnection, remote_folder: str, folder: str, files: dict, state: dict, full: bool) -> dict:
+    """
+    Для каждого файла решаем, что с ним делать. Базу, взятую из другого файла, копируем сразу,
+    до параллельной загрузки, чтобы ее не успели дописать.
+    """
+    plan = {}
+    for name, (size, mtime) in files.items():
+        local_path = os.path.join(folder, name)
+        known = state.get(name)
+        if (
+            not full and known and known['size'] == size and known['mtime'] == mtime
+            and os.path.isfile(local_path) and os.path.getsize(local_path) == size
+        ):
+            plan[name] = ('unchanged', 0)
+            continue
+
+        base = None if full else find_base(sftp, folder, posixpath.join(remote_folder, name), name, size, state)
+        if base is None:
+            plan[name] = ('downloaded', 0)
+        elif base[0] == name:
+            plan[name] = ('appended', base[1])
+        else:
+            shutil.copyfile(os.path.join(folder, base[0]), local_path + '.part')
+            plan[name] = ('rotated', base[1])
+    return plan
+
+
+def sync_file(sftp: SFTPConnection, remote_folder: str, folder: str, name: str, action: str, offset: int) -> int:
+    remote_path = posixpath.join(remote_folder, name)
+    local_path = os.path.join(folder, name)
+    if action == 'unchanged':
+        return 0
+    if action == 'appended':
+        # Если загрузка оборвется, размер не совпадет с сохраненным и файл в следующий раз скачается заново
+        with open(local_path, 'r+b') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            return sftp.copy_range(remote_path, offset, f)
+
+    with open(local_path + '.part', 'r+b' if action == 'rotated' else 'wb') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        copied = sftp.copy_range(remote_path, offset, f)
+    os.replace(local_path + '.part', local_path)
+    return copied
+
+
+def sync_logs(sftp: SFTPConnection, remote_folder: str, folder: str = LOGS_FOLDER, workers: int = 4, full: bool = False) -> None:
+    os.makedirs(folder, exist_ok=True)
+    state = load_state(folder)
+    files = {
+        name: attrs for name, attrs in sftp.list_files(remote_folder).items()
+        if name == LOG_NAME or name.startswith(LOG_NAME + '.')
+    }
+    plan = plan_sync(sftp, remote_folder, folder, files, state, full)
+
+    def run(name: str) -> tuple[str, Optional[int], Optional[Exception]]:
+        action, offset = plan[name]
+        try:
+            return name, sync_file(sftp, remote_folder, folder, name, action, offset), None
+        except Exception as e:
+            return name, None, e
+
+    new_state = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, copied, error in executor.map(run, sorted(files)):
+            size, mtime = files[name]
+            print(f'{Colors.BOLD}- {name}... {Colors.ENDC}', end='')
+            if error is not None:
+                print(f'{Colors.RED}failed ({error}){Colors.ENDC}')
+                continue
+            local_path = os.path.join(folder, name)
+            local_size = os.path.getsize(local_path)
+            # Пока качали, файл на сервере мог дописаться: запоминаем то, что реально скачано
+            new_state[name] = {
+                'size': local_size,
+                'mtime': mtime if local_size == size else 0,
+                'checksum': local_tail_checksum(local_path, local_size),
+            }
+            action = plan[name][0]
+            color = Colors.DARKGRAY if action == 'unchanged' else Colors.GREEN
+            transferred = f', +{humanize.naturalsize(copied)}' if action != 'unchanged' else ''
+            print(f'{color}{action}  {Colors.PURPLE}({humanize.naturalsize(local_size)}{transferred}){Colors.ENDC}')
+    save_state(folder, new_state)
+
+
 if __name__ == '__main__':
-    SERVER_WD = SERVER_WD.rstrip('/')
+    parser = argparse.ArgumentParser(description='Загрузка логов бота с сервера (только новые данные)')
+    parser.add_argument('--full', action='store_true', help='скачать все файлы целиком')
+    parser.add_argument('--workers', type=int, default=4, help='сколько файлов качать параллельно')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=22)
+    parser.add_argument('--user', default=USER)
+    parser.add_argument('--key', default=PRIVATE_KEY_PATH)
+    parser.add_argument('--remote-dir', default=SERVER_WD)
+    parser.add_argument('--output', default=LOGS_FOLDER)
+    args = parser.parse_args()
+
     colorama_init()
-    sftp = SFTPConnection()
-    print('Connection succesfully established ...')
+    sftp = SFTPConnection(host=args.host, user=args.user, port=args.port, key_filename=args.key)
     try:
-        files_to_download = ['info.log']
-        for file in files_to_download:
-            print(f'{Colors.BOLD}- {file}... {Colors.ENDC}', end='')
-            try:
-                sftp.get(f'{SERVER_WD}/{file}', file)
-                file_size = humanize.naturalsize(os.path.getsize(file))
-                print(f'{Colors.GREEN}downloaded  {Colors.PURPLE}({file_size}){Colors.ENDC}')
-            except Exception as e:
-                print(f'{Colors.RED}failed ({e}){Colors.ENDC}')
-
-        print('\n*** Файл на базе! ***\n')
+        sftp.sftp
+        print('Connection succesfully established ...')
+        sync_logs(sftp, args.remote_dir.rstrip('/'), args.output, workers=args.workers, full=args.full)
+        print('\n*** Файлы на базе! ***\n')
 
     except Exception as e:
         print(f'{e}\n{traceback.format_exc()}')
@@ -0,0 +1,154 @@
+"""
+Таблица лидеров среди пользователей бота (/leaderboard).
+
+Рейтинги всех пользователей раз в LEADERBOARD_REFRESH_INTERVAL скачиваются с Lichess пачками
+по 300 ников (POST /api/users) и сохраняются в таблицу ratings (sql/ratings.sql). Команда только
+читает первые строки по индексу, поэтому не обращается к Lichess и отвечает одинаково быстро
+при любом числе пользователей.
+"""
+import logging
+import time
+from datetime import date
+from typing import Optional
+
+import httpx
+from telegram.ext import Application, ContextTypes
+
+import metrics
+import settings
+from database import Database
+from lichess_client import LichessClient
+from logging_config import set_log_context
+from render import MessageBuilder, Template
+from scheduler import Priority
+from schemas import GameType, human_type
+
+logger = logging.getLogger(__name__)
+
+# Больше ников за один запрос Lichess не принимает
+LICHESS_USERS_BATCH = 300
+GAME_TYPES = {game_type.value.lower(): game_type for game_type in GameType}
+WEEK = 'week'
+
+TITLE_TEMPLATE = Template('*Лучшие рейтинги среди пользователей бота*')
+WEEK_TITLE_TEMPLATE = Template('*Изменение рейтинга за неделю среди пользователей бота*')
+TYPE_TEMPLATE = Template('\n\n  __{type}__')
+ENTRY_TEMPLATE = Template('\n    {place}\\. {username} — {rating}')
+WEEK_ENTRY_TEMPLATE = Template('\n    {place}\\. {username} — {diff} \\({rating}\\)')
+RATING_DIFF_TEMPLATE = Template('  \\({diff}\\)')
+EMPTY_TEMPLATE = Template('Рейтингов пока нет, загляни позже')
+USAGE_TEMPLATE = Template(
+    'Таблица лидеров среди пользователей бота:\n'
+    '/leaderboard — лучшие в каждом виде игр\n'
+    '/leaderboard week — кто больше всех вырос за неделю\n'
+    '/leaderboard blitz — лучшие в одном виде игр \\(можно добавить week\\)'
+)
+
+
+def schedule_ratings_refresh(app: Application) -> None:
+    # Первое обновление - вскоре после старта, чтобы не мешать прогреву кэшей
+    app.job_queue.run_repeating(refresh_ratings, interval=settings.LEADERBOARD_REFRESH_INTERVAL, first=60, name='refresh_ratings')
+
+
+def parse_ratings(user: dict) -> list[tuple[str, GameType, int, int, bool]]:
+    """Рейтинги из профиля Lichess по видам игр, которые знает бот (задачи, штурм и т.п. пропускаются)."""
+    username = user.get('username')
+    if not username or user.get('disabled'):
+        return []
+    ratings = []
+    for perf_name, perf in (user.get('perfs') or {}).items():
+        game_type = GAME_TYPES.get(perf_name.lower())
+        if game_type is None or not perf.get('games'):
+            continue
+        ratings.append((username, game_type, perf['rating'], perf['games'], bool(perf.get('prov'))))
+    return ratings
+
+
+async def fetch_ratings(lichess_usernames: list[str]) -> list[tuple[str, GameType, int, int, bool]]:
+    ratings = []
+    for start in range(0, len(lichess_usernames), LICHESS_USERS_BATCH):
+        batch = lichess_usernames[start:start + LICHESS_USERS_BATCH]
+        try:
+            response = await LichessClient().post(
+                '/api/users', ','.join(batch), headers={'Content-Type': 'text/plain'}, priority=Priority.BACKGROUND
+            )
+        except httpx.HTTPError as e:
+            logger.error(f'Ошибка соединения при получении рейтингов {len(batch)} игроков с Lichess: {e!r}')
+            continue
+        if response.status_code != 200:
+            logger.error(f'Ошибка при получении рейтингов {len(batch)} игроков с Lichess: {response.status_code} - {response.text}')
+            continue
+        for user in response.json():
+            ratings.extend(parse_ratings(user))
+    return ratings
+
+
+@metrics.timed('ratings_refresh_seconds', 'Время обновления таблицы рейтингов')
+async def refresh_ratings(context: ContextTypes.DEFAULT_TYPE) -> None:
+    set_log_context(job=context.job.name)
+    started = time.perf_counter()
+    db = Database()
+    lichess_usernames = await db.get_lichess_usernames()
+    if lichess_usernames is None:
+        return
+
+    # Один и тот же игрок может быть у нескольких пользователей - запрашиваем его один раз
+    players = list({lichess_username.lower(): lichess_username for lichess_username in lichess_usernames}.values())
+    ratings = await fetch_ratings(players)
+    day = date.today()
+    if ratings and not await db.store_ratings(day, ratings):
+        return
+    purged = await db.purge_ratings(day)
+    logger.info(
+        f'Рейтинги обновлены за {time.perf_counter() - started:.1f}s: игроков {len(players)}, '
+        f'рейтингов {len(ratings)}, удалено {purged or 0}'
+    )
+
+
+def _signed(change: int) -> str:
+    if change == 0:
+        return '0'
+    return f'{"+" if change > 0 else "−"}{abs(change)}'
+
+
+def render_leaderboard(entries: list[tuple[GameType, str, int, int]], by_week_change: bool) -> str:
+    if not entries:
+        return EMPTY_TEMPLATE.render()
+
+    builder = MessageBuilder().add(WEEK_TITLE_TEMPLATE if by_week_change else TITLE_TEMPLATE)
+    current_type = None
+    place = 0
+    for game_type, username, rating, week_change in entries:
+        if game_type != current_type:
+            builder.add(TYPE_TEMPLATE, type=human_type(game_type))
+            current_type = game_type
+            place = 0
+        place += 1
+        if by_week_change:
+            builder.add(WEEK_ENTRY_TEMPLATE, place=place, username=username, diff=_signed(week_change), rating=rating)
+        else:
+            builder.add(ENTRY_TEMPLATE, place=place, username=username, rating=rating)
+            if week_change:
+                builder.add(RATING_DIFF_TEMPLATE, diff=_signed(week_change))
+    return builder.build()
+
+
+async def get_leaderboard_message(args: list[str]) -> Optional[str]:
+    """args - аргументы команды: вид игр и/или week. None - если не удалось прочитать рейтинги из базы."""
+    by_week_change = False
+    game_types = list(GameType)
+    limit = settings.LEADERBOARD_SUMMARY_SIZE
+    for arg in args:
+        arg = arg.lower()
+        if arg == WEEK:
+            by_week_change = True
+        elif arg in GAME_TYPES:
+            game_types = [GAME_TYPES[arg]]
+            limit = settings.LEADERBOARD_SIZE
+        else:
+            return USAGE_TEMPLATE.render()
+
+    entries = await Database().get_leaderboard(game_types, limit, by_week_change=by_week_change)
+    if entries is None:
+        return None
+    return render_leaderboard(entries, by_week_change)
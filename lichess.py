@@ -1,68 +1,322 @@
+import contextlib
+import hashlib
+import json
 import logging
-from typing import Optional
+import re
+import sys
+import time
+from typing import NamedTuple, Optional
 
-import requests
-from telegram.helpers import escape_markdown
+import httpx
 
-from schemas import Activity, GeneralActivity, human_type
+import fast_schemas
+import metrics
+import settings
+from aggregate import ActivityAggregator, GeneralActivity
+from cache import TTLCache
+from lichess_client import LichessClient
+from logging_config import add_log_fields, bind_log_context
+from render import MessageBuilder, Raw, Template
+from scheduler import Priority
+from schemas import Activity, human_type
+from singleflight import SingleFlight
 from utils import prettify_interval
 
-logger = logging.getLogger('httpx')
+logger = logging.getLogger(__name__)
 
+NO_ACTIVITY_TEMPLATE = Template('У *{username}* в последнее время не было активности на Lichess')
+INTRO_TEMPLATE = Template('*Последняя активность {username} на Lichess \\({interval}\\)*')
+TOTAL_TEMPLATE = Template('\n\nВсего партий сыграно: {matches}')
+GAME_TEMPLATE = Template(
+    '\n\n  __{type}__\n    Партий сыграно: {matches}\n    Побед: {wins}\n    Поражений: {losses}\n    Ничьих: {draws}'
+    '\n    Изменение рейтинга: {rating_before} → {rating_after}'
+)
+RATING_DIFF_TEMPLATE = Template('  \\({diff}\\)')
+OPPONENT_TEMPLATE = Template('_{username} \\({rating}\\)_')
+CORRESPONDENCE_MOVES_TEMPLATE = Template('\n\n  __Игра по переписке:__\n    Сделано ходов: {total_moves}\n    В играх с: {opponents}')
+CORRESPONDENCE_ENDS_TEMPLATE = Template(
+    '\n    Завершено партий: {matches}\n    С оппонентами: {opponents}\n    Побед: {wins}'
+    '\n    Поражений: {losses}\n    Ничьих: {draws}'
+)
+PUZZLES_TEMPLATE = Template(
+    '\n\n  __Шахматные задачи__\n    Решено: {wins}\n    Не решено: {losses}'
+    '\n    Изменение рейтинга: {rating_before} → {rating_after}'
+)
 
-def get_lichess_activity_message(username: str) -> Optional[str]:
-    url = 'https://lichess.org/api/user/{username}/activity'
-    response = requests.get(url.format(username=username))
+
+STAGE_DESCRIPTION = 'Время этапов получения сообщения об активности'
+FETCH_SECONDS = metrics.histogram('activity_stage_seconds', STAGE_DESCRIPTION, stage='fetch')
+PARSE_SECONDS = metrics.histogram('activity_stage_seconds', STAGE_DESCRIPTION, stage='parse')
+AGGREGATE_SECONDS = metrics.histogram('activity_stage_seconds', STAGE_DESCRIPTION, stage='aggregate')
+RENDER_SECONDS = metrics.histogram('activity_stage_seconds', STAGE_DESCRIPTION, stage='render')
+STORE_SECONDS = metrics.histogram('activity_stage_seconds', STAGE_DESCRIPTION, stage='store')
+
+
+@contextlib.contextmanager
+def _stage(histogram: metrics.Histogram, stage: str):
+    """Время этапа идет и в метрики, и в контекст логов (поле <этап>_ms)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed)
+        add_log_fields(**{f'{stage}_ms': round(elapsed * 1000, 1)})
+
+
+class CachedActivity(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+
+
+class CachedMessage(NamedTuple):
+    fingerprint: bytes  # хэш ответа Lichess, из которого собрано сообщение
+    text: str
+
+
+activity_cache = TTLCache(
+    ttl=settings.ACTIVITY_CACHE_TTL,
+    max_entries=settings.ACTIVITY_CACHE_MAX_ENTRIES,
+    max_bytes=settings.ACTIVITY_CACHE_MAX_BYTES,
+    sizeof=lambda cached: len(cached.body),
+)
+metrics.register_cache('activity', activity_cache)
+# Готовые сообщения об активности по каноническому нику: одного игрока часто отслеживают несколько
+# пользователей, а сводки рассылаются сразу многим. Запись действительна, пока не изменился ответ Lichess,
+# поэтому срок жизни не нужен - размер ограничен только памятью
+message_cache = TTLCache(
+    max_entries=settings.MESSAGE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.MESSAGE_CACHE_MAX_BYTES,
+    sizeof=lambda cached: sys.getsizeof(cached.text) + len(cached.fingerprint),
+)
+metrics.register_cache('messages', message_cache)
+message_flights = SingleFlight()
+activity_store = None  # Хранилище активности по дням, см. set_activity_store
+username_flights = SingleFlight()
+
+# Ник на Lichess -> каноническое написание; '' означает, что такого пользователя нет
+username_cache = TTLCache(max_entries=settings.USERNAME_CACHE_MAX_ENTRIES)
+metrics.register_cache('usernames', username_cache)
+LICHESS_USERNAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,28}[A-Za-z0-9]$')
+
+
+async def fetch_activity(username: str, priority: Priority = Priority.INTERACTIVE) -> Optional[bytes]:
+    key = username.lower()
+    cached: Optional[CachedActivity] = activity_cache.get(key)
+    if cached is not None:
+        return cached.body
+
+    # Просроченную запись перепроверяем по ETag, чтобы не скачивать и не парсить ее заново
+    stale: Optional[CachedActivity] = activity_cache.get_stale(key)
+    headers = {'If-None-Match': stale.etag} if stale is not None and stale.etag else None
+    try:
+        response = await LichessClient().get(f'/api/user/{username}/activity', headers=headers, priority=priority)
+    except httpx.HTTPError as e:
+        logger.error(f'Ошибка соединения при получении активности пользователя {username} на Lichess: {e!r}')
+        return None
+    if response.status_code == 304 and stale is not None:
+        activity_cache.refresh(key)
+        return stale.body
     if response.status_code != 200:
-        logger.error(f'Ошибка при получении активности пользователя {username} на Lichess: {response.status_code} - {response.json()}')
+        logger.error(f'Ошибка при получении активности пользователя {username} на Lichess: {response.status_code} - {response.text}')
+        return None
+
+    activity_cache.set(key, CachedActivity(response.content, response.headers.get('ETag')))
+    return response.content
+
+
+def decode_activity(values: dict) -> Activity:
+    if settings.ACTIVITY_DECODER == 'fast':
+        return fast_schemas.Activity.decode(values, strict=settings.ACTIVITY_DECODER_STRICT)
+    return Activity(**values)
+
+
+def decode_activities(body: bytes) -> list[Activity]:
+    if settings.ACTIVITY_DECODER == 'fast':
+        return fast_schemas.decode_activities(body, strict=settings.ACTIVITY_DECODER_STRICT)
+    return [Activity(**activity) for activity in json.loads(body)]
+
+
+def iter_activities(body: bytes):
+    """Дни по одному, по мере разбора ответа."""
+    if settings.ACTIVITY_DECODER == 'fast':
+        return fast_schemas.iter_activities(body, strict=settings.ACTIVITY_DECODER_STRICT)
+    return (Activity(**activity) for activity in fast_schemas.iter_activity_items(body))
+
+
+def set_activity_store(store) -> None:
+    """store - объект с методами get_last_activity_day, upsert_activity_days и get_activity_days (см. Database)."""
+    global activity_store
+    activity_store = store
+
+
+async def _load_from_store(username: str, body: bytes) -> Optional[GeneralActivity]:
+    items = fast_schemas.loads(body)
+    if not items:
+        return GeneralActivity()
+    days = [fast_schemas.activity_date(item) for item in items]
+
+    with _stage(STORE_SECONDS, 'store'):
+        # Прошедшие дни уже не меняются: разбираем и сохраняем только дни начиная с последнего сохраненного
+        last_day = await activity_store.get_last_activity_day(username)
+        with _stage(PARSE_SECONDS, 'parse'):
+            fresh = [decode_activity(item) for item, day in zip(items, days) if last_day is None or day >= last_day]
+        if fresh and not await activity_store.upsert_activity_days(username, fresh):
+            return None
+
+        # Свежие дни уже разобраны, из базы читаем только более ранние
+        stored = []
+        if last_day is not None and min(days) < last_day:
+            stored = await activity_store.get_activity_days(username, since=min(days), until=last_day)
+            if stored is None:
+                return None
+    with _stage(AGGREGATE_SECONDS, 'aggregate'):
+        aggregator = ActivityAggregator()
+        for activity in fresh:
+            aggregator.add(activity)
+        stored_aggregator = ActivityAggregator()
+        for activity in stored:
+            stored_aggregator.add(activity)
+        return aggregator.merge(stored_aggregator).result()
+
+
+def activity_fingerprint(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+async def _general_activity_from_body(username: str, body: bytes) -> Optional[GeneralActivity]:
+    if activity_store is not None:
+        general_activity = await _load_from_store(username, body)
+        if general_activity is not None:
+            return general_activity
+    # Дни разбираются по одному прямо во время агрегации, поэтому здесь этап aggregate включает и разбор
+    with _stage(AGGREGATE_SECONDS, 'aggregate'):
+        return GeneralActivity.from_activities(iter_activities(body))
+
+
+async def _load_activity_message(username: str, priority: Priority) -> Optional[str]:
+    with _stage(FETCH_SECONDS, 'fetch'):
+        body = await fetch_activity(username, priority)
+    if body is None:
+        return None
+
+    fingerprint = activity_fingerprint(body)
+    stale: Optional[CachedMessage] = message_cache.get_stale(username)
+    if stale is not None and stale.fingerprint != fingerprint:
+        message_cache.pop(username)
+    cached: Optional[CachedMessage] = message_cache.get(username)
+    if cached is not None:
+        # Ответ Lichess тот же (в том числе после 304): разбор, агрегация и сохранение дней не нужны
+        return cached.text
+
+    general_activity = await _general_activity_from_body(username, body)
+    if general_activity is None:
         return None
+    with _stage(RENDER_SECONDS, 'render'):
+        text = render_activity_message(username, general_activity)
+    message_cache.set(username, CachedMessage(fingerprint, text))
+    return text
+
+
+async def get_lichess_activity_message(username: str, priority: Priority = Priority.INTERACTIVE) -> Optional[str]:
+    """username - каноническое написание ника: оно входит в текст сообщения и в ключ кэша."""
+    with bind_log_context(lichess_username=username):
+        return await message_flights.do(username, lambda: _load_activity_message(username, priority))
+
+
+def _rating_diff(builder: MessageBuilder, rating_before: int, rating_after: int) -> None:
+    if rating_before != rating_after:
+        sign = '+' if rating_after > rating_before else '−'
+        builder.add(RATING_DIFF_TEMPLATE, diff=f'{sign}{abs(rating_after - rating_before)}')
+
+
+def _opponents(opponent_ratings: list[tuple[str, int]]) -> Raw:
+    return Raw(', '.join(OPPONENT_TEMPLATE.render(username=username, rating=rating) for username, rating in opponent_ratings))
+
 
-    general_activity = GeneralActivity([Activity(**activity) for activity in response.json()])
+def render_activity_message(username: str, general_activity: GeneralActivity) -> str:
     if not general_activity.games and not general_activity.puzzles:
-        return f'У *{escape_markdown(username, version=2)}* в последнее время не было активности на Lichess'
+        return NO_ACTIVITY_TEMPLATE.render(username=username)
 
-    msg = ''
-    matches_played = 0
-    for game in general_activity.games:
-        matches_played += game.matches
-        msg += f'\n\n  __{human_type(game.type)}__\n    Партий сыграно: {game.matches}\n    Побед: {game.wins}\n    Поражений: {game.losses}\n    Ничьих: {game.draws}'
-        msg += f'\n    Изменение рейтинга: {game.rating_before} → {game.rating_after}'
-        if game.rating_before != game.rating_after:
-            diff = f'{"+" if game.rating_after > game.rating_before else "−"}{abs(game.rating_after - game.rating_before)}'
-            msg += f'  ({diff})'
-
-    if general_activity.correspondence_moves:
-        msg += f'\n\n  __Игра по переписке:__\n    Сделано ходов: {general_activity.correspondence_moves.total_moves}'
-        opponent_ratings: list[tuple[str, int]] = general_activity.correspondence_moves.opponent_ratings
-        opponents: str = ', '.join(f'_{escape_markdown(opponent_username)} ({opponent_rating})_' for opponent_username, opponent_rating in opponent_ratings)
-        msg += f'\n    В играх с: {opponents}'
-        if general_activity.correspondence_ends:
-            matches_played += general_activity.correspondence_ends.matches
-            opponent_ratings = general_activity.correspondence_ends.opponent_ratings
-            opponents = ', '.join(f'_{escape_markdown(opponent_username)} ({opponent_rating})_' for opponent_username, opponent_rating in opponent_ratings)
-            msg += f'\n    Завершено партий: {general_activity.correspondence_ends.matches}\n    С оппонентами: {opponents}\n    Побед: {general_activity.correspondence_ends.wins}'
-            msg += f'\n    Поражений: {general_activity.correspondence_ends.losses}\n    Ничьих: {general_activity.correspondence_ends.draws}'
-
-    if general_activity.puzzles:
-        msg += f'\n\n  __Шахматные задачи__\n    Решено: {general_activity.puzzles.wins}\n    Не решено: {general_activity.puzzles.losses}'
-        msg += f'\n    Изменение рейтинга: {general_activity.puzzles.rating_before} → {general_activity.puzzles.rating_after}'
-        if general_activity.puzzles.rating_before != general_activity.puzzles.rating_after:
-            diff = f'{"+" if general_activity.puzzles.rating_after > general_activity.puzzles.rating_before else "−"}{abs(general_activity.puzzles.rating_after - general_activity.puzzles.rating_before)}'
-            msg += f'  ({diff})'
-
-    intro = f'*Последняя активность {escape_markdown(username, version=2)} на Lichess ({prettify_interval(general_activity.from_date, general_activity.to_date)})*'
+    matches_played = sum(game.matches for game in general_activity.games)
+    if general_activity.correspondence_moves and general_activity.correspondence_ends:
+        matches_played += general_activity.correspondence_ends.matches
+
+    builder = MessageBuilder().add(
+        INTRO_TEMPLATE,
+        username=username,
+        interval=prettify_interval(general_activity.from_date, general_activity.to_date),
+    )
     if matches_played > 0:
-        msg = intro + f'\n\nВсего партий сыграно: {matches_played}' + msg
-    else:
-        msg = intro + msg
+        builder.add(TOTAL_TEMPLATE, matches=matches_played)
+
+    for game in general_activity.games:
+        builder.add(
+            GAME_TEMPLATE,
+            type=human_type(game.type),
+            matches=game.matches,
+            wins=game.wins,
+            losses=game.losses,
+            draws=game.draws,
+            rating_before=game.rating_before,
+            rating_after=game.rating_after,
+        )
+        _rating_diff(builder, game.rating_before, game.rating_after)
+
+    moves = general_activity.correspondence_moves
+    if moves:
+        builder.add(CORRESPONDENCE_MOVES_TEMPLATE, total_moves=moves.total_moves, opponents=_opponents(moves.opponent_ratings))
+        ends = general_activity.correspondence_ends
+        if ends:
+            builder.add(
+                CORRESPONDENCE_ENDS_TEMPLATE,
+                matches=ends.matches,
+                opponents=_opponents(ends.opponent_ratings),
+                wins=ends.wins,
+                losses=ends.losses,
+                draws=ends.draws,
+            )
+
+    puzzles = general_activity.puzzles
+    if puzzles:
+        builder.add(
+            PUZZLES_TEMPLATE,
+            wins=puzzles.wins,
+            losses=puzzles.losses,
+            rating_before=puzzles.rating_before,
+            rating_after=puzzles.rating_after,
+        )
+        _rating_diff(builder, puzzles.rating_before, puzzles.rating_after)
 
-    return msg.replace('(', '\(').replace(')', '\)').replace('+', '\+').replace('-', '\-')
+    return builder.build()
 
 
-def get_lichess_username_from_id(lichess_id: str) -> Optional[str]:
-    url = f'https://lichess.org/api/user/{lichess_id}'
-    response = requests.get(url)
+async def get_lichess_username_from_id(lichess_id: str, priority: Priority = Priority.INTERACTIVE) -> Optional[str]:
+    if not LICHESS_USERNAME_RE.match(lichess_id):
+        return None
+    key = lichess_id.lower()
+    cached: Optional[str] = username_cache.get(key)
+    if cached is not None:
+        return cached or None
+    return await username_flights.do(key, lambda: _fetch_lichess_username(lichess_id, priority))
+
+
+def remember_lichess_username(username: str) -> None:
+    username_cache.set(username.lower(), username, ttl=settings.USERNAME_CACHE_TTL)
+
+
+async def _fetch_lichess_username(lichess_id: str, priority: Priority) -> Optional[str]:
+    try:
+        response = await LichessClient().get(f'/api/user/{lichess_id}', priority=priority)
+    except httpx.HTTPError as e:
+        logger.error(f'Ошибка соединения при получении пользователя по ID {lichess_id} на Lichess: {e!r}')
+        return None
     if response.status_code == 200:
-        return response.json().get('username')
-    if response.status_code != 404:
-        logging.error(f'Ошибка при получении пользователя по ID {lichess_id} на Lichess: {response.status_code} - {response.json()}')
\ No newline at end of file
+        username = response.json().get('username')
+        if username:
+            remember_lichess_username(username)
+        return username
+    if response.status_code == 404:
+        username_cache.set(lichess_id.lower(), '', ttl=settings.USERNAME_CACHE_NEGATIVE_TTL)
+    else:
+        logger.error(f'Ошибка при получении пользователя по ID {lichess_id} на Lichess: {response.status_code} - {response.text}')
\ No newline at end of file
@@ -0,0 +1,127 @@
+import contextlib
+import importlib.util
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+import metrics
+import settings
+from scheduler import Priority, RequestScheduler
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 в httpx работает только при установленном пакете h2
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+REQUEST_SECONDS = metrics.histogram('lichess_request_seconds', 'Время запросов к Lichess (без ожидания в очереди)')
+QUEUE_SECONDS = metrics.histogram('lichess_queue_seconds', 'Время ожидания запроса к Lichess в очереди планировщика')
+
+
+class LichessClient:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, '_client', None) is None:
+            self._client: Optional[httpx.AsyncClient] = None
+        if getattr(self, 'scheduler', None) is None:
+            self.scheduler = RequestScheduler(
+                rate=settings.LICHESS_RATE,
+                burst=settings.LICHESS_BURST,
+                max_concurrency=settings.LICHESS_MAX_CONCURRENT_REQUESTS,
+                rate_limit_pause=settings.LICHESS_RATE_LIMIT_PAUSE,
+                max_retries=settings.LICHESS_RATE_LIMIT_RETRIES,
+            )
+            metrics.gauge('lichess_queue_size', lambda: self.scheduler.queue_size, 'Запросов к Lichess в очереди')
+            metrics.gauge('lichess_blocked_seconds', lambda: self.scheduler.blocked_for, 'Сколько еще ждать после 429')
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=settings.LICHESS_BASE_URL,
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(
+                    connect=settings.LICHESS_CONNECT_TIMEOUT,
+                    read=settings.LICHESS_READ_TIMEOUT,
+                    write=settings.LICHESS_READ_TIMEOUT,
+                    pool=settings.LICHESS_CONNECT_TIMEOUT,
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.LICHESS_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LICHESS_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LICHESS_KEEPALIVE_EXPIRY,
+                ),
+                headers={'Accept': 'application/json'},
+            )
+        return self._client
+
+    async def get(self, path: str, headers: Optional[dict] = None, priority: Priority = Priority.INTERACTIVE) -> httpx.Response:
+        submitted = time.perf_counter()
+        return await self.scheduler.submit(lambda: self._request('GET', path, submitted, headers=headers), priority)
+
+    async def post(self, path: str, content: str, headers: Optional[dict] = None, priority: Priority = Priority.INTERACTIVE) -> httpx.Response:
+        submitted = time.perf_counter()
+        return await self.scheduler.submit(lambda: self._request('POST', path, submitted, headers=headers, content=content), priority)
+
+    @contextlib.asynccontextmanager
+    async def stream(
+        self,
+        path: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        GET, тело которого читается по мере поступления (response.aiter_bytes() и т.п.).
+        Место в планировщике освобождается, как только пришли заголовки, поэтому долгая выгрузка
+        не задерживает остальные запросы. При выходе из блока соединение закрывается, даже если
+        тело прочитано не до конца.
+        """
+        submitted = time.perf_counter()
+        response = await self.scheduler.submit(
+            lambda: self._request('GET', path, submitted, headers=headers, params=params, stream=True), priority
+        )
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        submitted: float,
+        headers: Optional[dict] = None,
+        content: Optional[str] = None,
+        params: Optional[dict] = None,
+        stream: bool = False,
+    ) -> httpx.Response:
+        started = time.perf_counter()
+        QUEUE_SECONDS.observe(started - submitted)
+        try:
+            request = self.client.build_request(method, path, headers=headers, content=content, params=params)
+            response = await self.client.send(request, stream=stream)
+            if stream and response.status_code != 200:
+                # Ошибку дочитываем сразу: планировщик может повторить запрос после 429, не закрыв этот ответ
+                await response.aread()
+        except httpx.HTTPError:
+            metrics.counter('lichess_responses_total', 'Ответы Lichess по статусам', status='error').inc()
+            raise
+        finally:
+            # Для стрима - время до получения заголовков
+            REQUEST_SECONDS.observe(time.perf_counter() - started)
+        metrics.counter('lichess_responses_total', 'Ответы Lichess по статусам', status=response.status_code).inc()
+        return response
+
+    async def close(self) -> None:
+        await self.scheduler.close()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,107 @@
+"""
+Настройка логов: запись в файл идет в отдельном потоке через очередь, поэтому обработчики
+не ждут диска. Файл ротируется по размеру или по времени и не обнуляется при перезапуске.
+
+Поля текущего запроса (chat_id, ник на Lichess, время этапов) хранятся в contextvar и
+добавляются к каждой записи автоматически, см. bind_log_context и add_log_fields.
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+from typing import Any
+
+import settings
+
+_log_context: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar('log_context', default={})
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s%(context_suffix)s'
+
+
+def set_log_context(**fields) -> None:
+    """Заменяет контекст целиком - для начала обработки нового апдейта."""
+    _log_context.set(fields)
+
+
+def add_log_fields(**fields) -> None:
+    # Словарь не меняем на месте: его копии могут быть у других задач
+    _log_context.set({**_log_context.get(), **fields})
+
+
+@contextlib.contextmanager
+def bind_log_context(**fields):
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """Снимает контекст и форматирует сообщение еще в потоке вызывающего кода."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.context = _log_context.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, 'context', None)
+        record.context_suffix = ' [' + ' '.join(f'{key}={value}' for key, value in context.items()) + ']' if context else ''
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': f'{record.filename}:{record.lineno}',
+            'message': record.getMessage(),
+            **getattr(record, 'context', {}),
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _file_handler() -> logging.Handler:
+    if settings.LOG_ROTATION == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            settings.LOG_FILE, when=settings.LOG_ROTATE_WHEN, backupCount=settings.LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        settings.LOG_FILE, maxBytes=settings.LOG_MAX_BYTES, backupCount=settings.LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+
+def setup_logging() -> None:
+    handler = _file_handler()
+    handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == 'json' else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем все, что осталось в очереди
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [_ContextQueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL)
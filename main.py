@@ -1,55 +1,101 @@
+import hashlib
+import json
 import logging
+import time
 import traceback
+from typing import Optional
 from zoneinfo import ZoneInfo
 
 from telegram import (
     Update,
     BotCommandScopeAllPrivateChats,
     BotCommandScopeChat,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
 )
+from telegram.constants import ChatAction, MessageLimit
 from telegram.ext import (
     Application,
     CommandHandler,
+    CallbackQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
     Defaults,
+    AIORateLimiter,
+    TypeHandler,
 )
 from telegram.helpers import escape_markdown
+from telegram.request import BaseRequest
 
+import metrics
+import settings
+from conversation import AWAITING_LICHESS_USERNAME, COMMANDS_VERSION, MemoryConversationStore
 from data import TOKEN, MY_ID
 from database import Database
-from lichess import get_lichess_activity_message, get_lichess_username_from_id
+from digest import DAILY, FREQUENCIES, schedule_digests
+from games import get_games_message, parse_games_args, usage as games_usage
+from leaderboard import get_leaderboard_message, schedule_ratings_refresh
+from lichess import get_lichess_activity_message, get_lichess_username_from_id, remember_lichess_username, set_activity_store
+from lichess_client import LichessClient
+from logging_config import set_log_context, setup_logging
 
+logger = logging.getLogger(__name__)
 
+HANDLER_DESCRIPTION = 'Время обработки апдейтов по обработчикам'
+
+
+class InstrumentedRateLimiter(AIORateLimiter):
+    """Через лимитер проходят все запросы к Bot API, поэтому здесь удобно мерить их время (вместе с ожиданием лимита)."""
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        with metrics.histogram('telegram_request_seconds', 'Время запросов к Telegram Bot API', method=endpoint).time():
+            return await super().process_request(callback, args, kwargs, endpoint, data, rate_limit_args)
+
+
+async def bind_update_log_context(update: object, context: ContextTypes.DEFAULT_TYPE):
+    # Первым для каждого апдейта: все записи в логах при его обработке получат эти поля
+    if isinstance(update, Update):
+        chat = update.effective_chat
+        set_log_context(update_id=update.update_id, chat_id=chat.id if chat else None)
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat = update.effective_chat
-    if chat.id not in about_to_set_lichess_username:
+    if await conversations.get_conversation_state(chat.id, AWAITING_LICHESS_USERNAME) is None:
         return
 
-    lichess_username = get_lichess_username_from_id(update.message.text.strip())
+    lichess_username = await get_lichess_username_from_id(update.message.text.strip())
     if lichess_username is None:
         await update.message.reply_text('Такого пользователя не существует, повтори попытку')
         return
 
-    about_to_set_lichess_username.remove(chat.id)
-    db.update_lichess_username(chat.id, lichess_username)
+    if not await conversations.delete_conversation_state(chat.id, AWAITING_LICHESS_USERNAME):
+        # Ник уже установлен в другом процессе бота
+        return
+    await db.update_lichess_username(chat.id, lichess_username)
     await send_lichess_activity(update, lichess_username)
 
 
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='start')
 async def command_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global COMMANDS_SET
     chat = update.effective_chat
     if update.message.chat.PRIVATE:
-        if chat.id == MY_ID and not COMMANDS_SET:
-            COMMANDS_SET = True
+        if chat.id == MY_ID and await conversations.get_conversation_state(MY_ID, COMMANDS_VERSION) != commands_version:
+            await conversations.set_conversation_state(MY_ID, COMMANDS_VERSION, commands_version)
             await context.bot.set_my_commands(commands=bot_commands, scope=BotCommandScopeAllPrivateChats())
             await context.bot.set_my_commands(commands=bot_commands_admin, scope=BotCommandScopeChat(MY_ID))
             await update.message.reply_text('👌')
             return
 
-        user = db.get_user(chat.id)
-        if user:
+        result = await db.get_or_create_user(chat.id, chat.username, chat.first_name, chat.last_name)
+        if result is None:
+            await update.message.reply_text('Что-то пошло не так, попробуй еще раз позже')
+            return
+
+        user, created = result
+        if not created:
             if user.lichess_username:
                 await send_lichess_activity(
                     update=update,
@@ -63,32 +109,150 @@ async def command_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await command_set_lichess_username(update, context)
 
         else:
-            db.add_user(chat.id, chat.username, chat.first_name, chat.last_name)
             await context.bot.send_message(MY_ID, f'Добавлен пользователь @{chat.username} ({chat.id})')
-            about_to_set_lichess_username.add(chat.id)
+            await conversations.set_conversation_state(chat.id, AWAITING_LICHESS_USERNAME, ttl=settings.CONVERSATION_STATE_TTL)
             await update.message.reply_text('Твой ник на Lichess?')
 
 
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='set_lichess_username')
 async def command_set_lichess_username(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    about_to_set_lichess_username.add(update.effective_chat.id)
+    await conversations.set_conversation_state(update.effective_chat.id, AWAITING_LICHESS_USERNAME, ttl=settings.CONVERSATION_STATE_TTL)
     await update.message.reply_text('Напиши свой ник на Lichess')
 
 
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='digest')
+async def command_digest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    frequency = context.args[0].lower() if context.args else None
+    if frequency not in (*FREQUENCIES, 'off'):
+        await update.message.reply_text(
+            'Сводка активности на Lichess:\n'
+            '/digest daily — каждый день\n'
+            '/digest weekly — раз в неделю\n'
+            '/digest off — отключить'
+        )
+        return
+
+    await db.set_digest_subscription(update.effective_chat.id, None if frequency == 'off' else frequency)
+    if frequency == 'off':
+        await update.message.reply_text('Сводки отключены')
+    else:
+        await update.message.reply_text(f'Буду присылать сводку {"каждый день" if frequency == DAILY else "раз в неделю"} в {settings.DIGEST_TIME}')
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='games')
+async def command_games(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    parsed = parse_games_args(context.args or [])
+    if parsed is None:
+        await update.message.reply_text(games_usage(), parse_mode='markdownV2')
+        return
+
+    user = await db.get_user(update.effective_chat.id)
+    if user is None or not user.lichess_username:
+        await command_set_lichess_username(update, context)
+        return
+
+    # Выгрузка сотни партий идет несколько секунд
+    await context.bot.send_chat_action(update.effective_chat.id, ChatAction.TYPING)
+    limit, game_type = parsed
+    msg = await get_games_message(user.lichess_username, limit, game_type)
+    if msg is None:
+        await update.message.reply_text(f'Не удалось получить партии пользователя {user.lichess_username} на Lichess')
+        return
+    await update.message.reply_text(msg, parse_mode='markdownV2')
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='leaderboard')
+async def command_leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    msg = await get_leaderboard_message(context.args or [])
+    if msg is None:
+        await update.message.reply_text('Не удалось получить таблицу лидеров, попробуй еще раз позже')
+        return
+    await update.message.reply_text(msg, parse_mode='markdownV2')
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='_users')
 async def command_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_chat.id != MY_ID:
         return
 
-    users = db.get_all_users()
-    msg = '*Пользователи бота:*\n'
-    for no, user in enumerate(users, start=1):
-        user.tg_last_name = f' {escape_markdown(user.tg_last_name)}' if user.tg_last_name else ''
+    msg, keyboard = await render_users_page()
+    await context.bot.send_message(MY_ID, msg, parse_mode='markdown', reply_markup=keyboard)
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='users_page')
+async def handle_users_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_chat.id != MY_ID:
+        await query.answer()
+        return
+
+    _, direction, cursor = query.data.split(':')
+    if direction == 'next':
+        msg, keyboard = await render_users_page(after_id=int(cursor))
+    else:
+        msg, keyboard = await render_users_page(before_id=int(cursor))
+    await query.answer()
+    await query.edit_message_text(msg, parse_mode='markdown', reply_markup=keyboard)
+
+
+@metrics.timed('telegram_handler_seconds', HANDLER_DESCRIPTION, handler='_stats')
+async def command_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.id != MY_ID:
+        return
+
+    lines = metrics.REGISTRY.summary() or ['Метрик пока нет']
+    # Сводка может не влезть в одно сообщение - делим по строкам
+    chunk = []
+    length = 0
+    for line in lines:
+        line = escape_markdown(line, version=2, entity_type='pre')
+        if chunk and length + len(line) + 1 > MessageLimit.MAX_TEXT_LENGTH - 8:
+            await context.bot.send_message(MY_ID, '```\n' + '\n'.join(chunk) + '\n```', parse_mode='markdownV2')
+            chunk, length = [], 0
+        chunk.append(line)
+        length += len(line) + 1
+    await context.bot.send_message(MY_ID, '```\n' + '\n'.join(chunk) + '\n```', parse_mode='markdownV2')
+
+
+async def render_users_page(after_id: int = 0, before_id: int = None) -> tuple[str, Optional[InlineKeyboardMarkup]]:
+    page = await db.get_users_page(settings.USERS_PAGE_SIZE, after_id=after_id, before_id=before_id)
+    if page is None:
+        return 'Не удалось получить список пользователей', None
+    users, has_more = page
+    if not users:
+        return 'Пользователей нет', None
+
+    lines = []
+    for user in users:
+        tg_last_name = f' {escape_markdown(user.tg_last_name)}' if user.tg_last_name else ''
         lichess_username = escape_markdown(user.lichess_username) if user.lichess_username else '_ник на Lichess не установлен_'
-        msg += f'\n{no}) @{escape_markdown(user.tg_username)} ({user.tg_id}) — {escape_markdown(user.tg_first_name)}{user.tg_last_name} → {lichess_username}'
-    await context.bot.send_message(MY_ID, msg, parse_mode='markdown')
+        lines.append(f'\n{user.id}) @{escape_markdown(user.tg_username)} ({user.tg_id}) — {escape_markdown(user.tg_first_name)}{tg_last_name} → {lichess_username}')
+
+    # Если страница не влезает в одно сообщение, отбрасываем дальние от курсора строки
+    header = '*Пользователи бота:*\n'
+    length = len(header) + sum(len(line) for line in lines)
+    truncated = False
+    while length > MessageLimit.MAX_TEXT_LENGTH and len(lines) > 1:
+        drop = 0 if before_id is not None else -1
+        length -= len(lines.pop(drop))
+        users.pop(drop)
+        truncated = True
+
+    if before_id is None:
+        has_prev, has_next = after_id > 0, has_more or truncated
+    else:
+        has_prev, has_next = has_more or truncated, True
+
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton('◀️', callback_data=f'users:prev:{users[0].id}'))
+    if has_next:
+        buttons.append(InlineKeyboardButton('▶️', callback_data=f'users:next:{users[-1].id}'))
+    return header + ''.join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
 
 
 async def send_lichess_activity(update: Update, lichess_username: str, context: ContextTypes.DEFAULT_TYPE = None, tg_username: str = None, tg_id: int = None) -> None:
-    msg = get_lichess_activity_message(lichess_username)
+    msg = await get_lichess_activity_message(lichess_username)
     if msg is None:
         await update.message.reply_text(f'Не удалось получить активность пользователя {lichess_username} на Lichess')
         if update.effective_chat.id != MY_ID:
@@ -97,53 +261,147 @@ async def send_lichess_activity(update: Update, lichess_username: str, context:
     await update.message.reply_text(msg, parse_mode='markdownV2')
 
 
+async def purge_conversation_state(context: ContextTypes.DEFAULT_TYPE) -> None:
+    purged = await conversations.purge_conversation_state()
+    if purged:
+        logger.info(f'Удалено просроченных состояний диалогов: {purged}')
+
+
+async def warm_up_caches(context: ContextTypes.DEFAULT_TYPE) -> None:
+    users = await db.warm_up_user_cache()
+    # Канонические ники уже известны из базы, повторно спрашивать их у Lichess не нужно
+    for user in users:
+        if user.lichess_username:
+            remember_lichess_username(user.lichess_username)
+
+
+async def post_init(app: Application) -> None:
+    if settings.METRICS_PORT:
+        app.bot_data['metrics_server'] = await metrics.start_http_server(settings.METRICS_LISTEN, settings.METRICS_PORT)
+    # Пул и миграции создаются при первом обращении к базе, а прогрев кэша идет в фоне - старт их не ждет
+    if settings.ACTIVITY_STORE:
+        set_activity_store(db)
+    if settings.USER_CACHE_WARM_UP:
+        app.job_queue.run_once(warm_up_caches, when=0, name='warm_up_caches')
+
+    startup_seconds = time.perf_counter() - started_at
+    metrics.gauge('startup_seconds', lambda: startup_seconds, 'Время от запуска бота до готовности принимать апдейты')
+    print(f'Started in {startup_seconds:.2f}s')
+
+
+async def post_shutdown(app: Application) -> None:
+    metrics_server = app.bot_data.get('metrics_server')
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await LichessClient().close()
+    await db.close()
+
+
 async def handle_error(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    metrics.counter('telegram_handler_errors_total', 'Необработанные исключения в обработчиках', error=type(context.error).__name__).inc()
     logger.error(f'{context.error}\n{traceback.format_exc()}')
 
 
-def run_bot():
-    print('Starting bot...')
+def build_application(base_url: Optional[str] = None, request: Optional[BaseRequest] = None, rate_limiter: bool = True) -> Application:
+    """
+    Приложение со всеми обработчиками и задачами. base_url и request позволяют направить
+    запросы к Bot API на другой сервер (см. benchmarks/load_test.py).
+    """
     defaults = Defaults(tzinfo=ZoneInfo('Europe/Moscow'))
-    app = Application.builder().token(TOKEN).defaults(defaults).build()
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .defaults(defaults)
+        .concurrent_updates(settings.MAX_CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if rate_limiter:
+        builder.rate_limiter(InstrumentedRateLimiter(max_retries=1))
+    if base_url is not None:
+        builder.base_url(base_url)
+    if request is not None:
+        builder.request(request)
+    app = builder.build()
+
+    app.add_handler(TypeHandler(Update, bind_update_log_context), group=-1)
 
     # Commands
     app.add_handler(CommandHandler('start', command_start))
     app.add_handler(CommandHandler('set_lichess_username', command_set_lichess_username))
+    app.add_handler(CommandHandler('digest', command_digest))
+    app.add_handler(CommandHandler('games', command_games))
+    app.add_handler(CommandHandler('leaderboard', command_leaderboard))
     app.add_handler(CommandHandler('_users', command_users))
+    app.add_handler(CommandHandler('_stats', command_stats))
+    app.add_handler(CallbackQueryHandler(handle_users_page, pattern=r'^users:(next|prev):\d+$'))
+
+    # Jobs
+    schedule_digests(app)
+    schedule_ratings_refresh(app)
+    app.job_queue.run_repeating(purge_conversation_state, interval=settings.CONVERSATION_PURGE_INTERVAL, name='purge_conversation_state')
 
     # Errors
     app.add_error_handler(handle_error)
 
     # Messages
     app.add_handler(MessageHandler(filters.TEXT, handle_message))
+    return app
+
+
+def run_bot():
+    print('Starting bot...')
+    app = build_application()
 
-    # Pools the bot
-    print('Polling...')
-    app.run_polling(poll_interval=1)
+    if settings.BOT_MODE == 'webhook':
+        if not settings.WEBHOOK_SECRET_TOKEN:
+            raise RuntimeError('WEBHOOK_SECRET_TOKEN must be set in webhook mode')
+        # Апдейты без правильного X-Telegram-Bot-Api-Secret-Token отклоняются с 403.
+        # По SIGINT/SIGTERM сервер перестает принимать запросы, а уже полученные апдейты дообрабатываются
+        print(f'Listening for webhooks on {settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT}/{settings.WEBHOOK_PATH}...')
+        app.run_webhook(
+            listen=settings.WEBHOOK_LISTEN,
+            port=settings.WEBHOOK_PORT,
+            url_path=settings.WEBHOOK_PATH,
+            webhook_url=settings.WEBHOOK_URL,
+            secret_token=settings.WEBHOOK_SECRET_TOKEN,
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        # Pools the bot
+        print('Polling...')
+        app.run_polling(poll_interval=1)
 
 
 if __name__ == '__main__':
+    started_at = time.perf_counter()
+
     # Настройка логов
-    logging.basicConfig(
-        format='%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
-        filename='info.log',
-        filemode='w',
-        level=logging.INFO
-    )
-    logger = logging.getLogger('httpx')
-    logger.setLevel(logging.WARNING)
+    setup_logging()
+    # httpx пишет в INFO каждый запрос к Lichess и Telegram
+    logging.getLogger('httpx').setLevel(logging.WARNING)
 
     db = Database()
-    COMMANDS_SET = False
-    about_to_set_lichess_username = set()
+    # Состояние диалогов в базе общее для всех процессов бота и переживает перезапуск
+    conversations = db if settings.CONVERSATION_STORE == 'postgres' else MemoryConversationStore()
 
     bot_commands = [
         ('start', 'Старт'),
         ('set_lichess_username', 'Установить ник на Lichess'),
+        ('digest', 'Сводки активности'),
+        ('games', 'Сводка по последним партиям'),
+        ('leaderboard', 'Таблица лидеров'),
     ]
     bot_commands_admin = [
         ('start', 'Старт'),
         ('set_lichess_username', 'Установить ник на Lichess'),
-        ('_users', 'Список пользователей')
+        ('digest', 'Сводки активности'),
+        ('games', 'Сводка по последним партиям'),
+        ('leaderboard', 'Таблица лидеров'),
+        ('_users', 'Список пользователей'),
+        ('_stats', 'Метрики бота'),
     ]
+    # Команды заново отправляются в Telegram только если список изменился
+    commands_version = hashlib.sha1(json.dumps([bot_commands, bot_commands_admin]).encode()).hexdigest()
     run_bot()
@@ -0,0 +1,248 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import logging
+import math
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, labels: Labels = ()):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        return [(self.name, self.labels, self.value)]
+
+
+class Gauge:
+    """Значение считывается функцией в момент сбора, поэтому код, который меряем, ничего не обновляет."""
+    type = 'gauge'
+
+    def __init__(self, name: str, func: Callable[[], float], labels: Labels = (), type: str = 'gauge'):
+        self.name = name
+        self.labels = labels
+        self.func = func
+        self.type = type
+
+    @property
+    def value(self) -> float:
+        return self.func()
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        return [(self.name, self.labels, self.value)]
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS, labels: Labels = ()):
+        self.name = name
+        self.buckets = buckets
+        self.labels = labels
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @contextlib.contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль (для последней корзины - максимум)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def samples(self) -> list[tuple[str, Labels, float]]:
+        samples = []
+        total = 0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            total += count
+            samples.append((f'{self.name}_bucket', self.labels + (('le', _format_value(float(bound))),), total))
+        samples.append((f'{self.name}_sum', self.labels, self.sum))
+        samples.append((f'{self.name}_count', self.labels, self.count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[tuple[str, Labels], Any] = {}
+        self._descriptions: dict[str, str] = {}
+
+    def _get_or_create(self, name: str, description: str, labels: dict[str, Any], create: Callable[[Labels], Any]) -> Any:
+        key = (name, tuple((label, str(value)) for label, value in sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            metric = self._metrics[key] = create(key[1])
+            if description:
+                self._descriptions.setdefault(name, description)
+        return metric
+
+    def counter(self, name: str, description: str = '', **labels) -> Counter:
+        return self._get_or_create(name, description, labels, lambda labels_: Counter(name, labels_))
+
+    def histogram(self, name: str, description: str = '', buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get_or_create(name, description, labels, lambda labels_: Histogram(name, buckets, labels_))
+
+    def gauge(self, name: str, func: Callable[[], float], description: str = '', type: str = 'gauge', **labels) -> Gauge:
+        """type='counter' - для монотонно растущих значений, которые уже где-то считаются (например, попадания в кэш)."""
+        gauge = self._get_or_create(name, description, labels, lambda labels_: Gauge(name, func, labels_, type))
+        gauge.func = func
+        return gauge
+
+    def collect(self) -> dict[str, list]:
+        families: dict[str, list] = {}
+        for (name, _), metric in sorted(self._metrics.items()):
+            families.setdefault(name, []).append(metric)
+        return families
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат Prometheus 0.0.4."""
+        lines = []
+        for name, metrics in self.collect().items():
+            if name in self._descriptions:
+                lines.append(f'# HELP {name} {self._descriptions[name]}')
+            lines.append(f'# TYPE {name} {metrics[0].type}')
+            for metric in metrics:
+                try:
+                    samples = metric.samples()
+                except Exception as e:
+                    logger.warning(f'Не удалось получить значение метрики {name}: {e!r}')
+                    continue
+                for sample_name, labels, value in samples:
+                    lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> list[str]:
+        """Краткая сводка для людей: по строке на метрику."""
+        lines = []
+        for name, metrics in self.collect().items():
+            for metric in metrics:
+                labels = _format_labels(metric.labels)
+                if isinstance(metric, Histogram):
+                    if metric.count:
+                        lines.append(
+                            f'{name}{labels}: n={metric.count} mean={metric.mean * 1000:.1f}ms '
+                            f'p95<={metric.quantile(0.95) * 1000:.1f}ms max={metric.max * 1000:.1f}ms'
+                        )
+                    continue
+                if isinstance(metric, Counter) and not metric.value:
+                    continue
+                try:
+                    value = metric.value
+                except Exception:
+                    continue
+                lines.append(f'{name}{labels}: {value:.3g}' if isinstance(value, float) else f'{name}{labels}: {value}')
+        return lines
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+
+
+def timed(name: str, description: str = '', **labels):
+    """Декоратор для корутин: время выполнения пишется в гистограмму name."""
+    def decorator(func):
+        observed = histogram(name, description, **labels)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with observed.time():
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_cache(name: str, cache) -> None:
+    """Метрики TTLCache: попадания, промахи, доля попаданий, количество записей и размер."""
+    gauge('cache_hits_total', lambda: cache.hits, 'Попадания в кэш', type='counter', cache=name)
+    gauge('cache_misses_total', lambda: cache.misses, 'Промахи кэша', type='counter', cache=name)
+    gauge('cache_hit_ratio', lambda: cache.hit_ratio, 'Доля попаданий в кэш', cache=name)
+    gauge('cache_entries', lambda: len(cache), 'Записей в кэше', cache=name)
+    gauge('cache_size_bytes', lambda: cache.size_bytes, 'Размер кэша в байтах', cache=name)
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while await asyncio.wait_for(reader.readline(), timeout=5) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+            status, body = '200 OK', REGISTRY.render_prometheus().encode()
+        else:
+            status, body = '404 Not Found', b'Not found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """GET /metrics в формате Prometheus. Если порт занят, бот работает дальше без эндпоинта."""
+    try:
+        server = await asyncio.start_server(_handle_http, host, port)
+    except OSError as e:
+        logger.error(f'Не удалось запустить эндпоинт метрик на {host}:{port}: {e!r}')
+        return None
+    logger.info(f'Метрики доступны на http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,70 @@
+"""
+Применение SQL-файлов из sql/ к базе. Контрольная сумма каждого примененного файла хранится
+в schema_migrations, поэтому при старте выполняются только новые и измененные файлы.
+Файлы должны оставаться идемпотентными (IF NOT EXISTS, CREATE OR REPLACE): измененный файл
+выполняется заново целиком.
+"""
+import hashlib
+import logging
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Несколько процессов бота могут стартовать одновременно - миграции применяет только один
+MIGRATIONS_LOCK_ID = 7_021_994
+
+CREATE_MIGRATIONS_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+'''
+
+
+def read_migrations(files: list[str]) -> list[tuple[str, str, str]]:
+    """(имя, sql, контрольная сумма) в порядке применения."""
+    migrations = []
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append((file, sql, hashlib.sha256(sql.encode()).hexdigest()))
+    return migrations
+
+
+async def _applied_checksums(conn: asyncpg.Connection) -> dict[str, str]:
+    return {row['name']: row['checksum'] for row in await conn.fetch('SELECT name, checksum FROM schema_migrations;')}
+
+
+async def apply_migrations(conn: asyncpg.Connection, files: list[str]) -> list[str]:
+    """Возвращает имена примененных файлов (пустой список, если все уже применено)."""
+    migrations = read_migrations(files)
+    try:
+        applied = await _applied_checksums(conn)
+    except asyncpg.UndefinedTableError:
+        applied = {}
+    if all(applied.get(name) == checksum for name, _, checksum in migrations):
+        return []
+
+    await conn.execute('SELECT pg_advisory_lock($1);', MIGRATIONS_LOCK_ID)
+    try:
+        await conn.execute(CREATE_MIGRATIONS_TABLE)
+        # Пока ждали блокировку, другой процесс мог уже все применить
+        applied = await _applied_checksums(conn)
+        done = []
+        for name, sql, checksum in migrations:
+            if applied.get(name) == checksum:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    'INSERT INTO schema_migrations (name, checksum) VALUES ($1, $2) '
+                    'ON CONFLICT (name) DO UPDATE SET checksum = EXCLUDED.checksum, applied_at = now();',
+                    name, checksum,
+                )
+            logger.info(f'Применена миграция {name}')
+            done.append(name)
+        return done
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1);', MIGRATIONS_LOCK_ID)
@@ -0,0 +1,52 @@
+# Отправляет записанные апдейты Telegram (JSON) на локальный вебхук бота, запущенного с BOT_MODE=webhook.
+#
+#   python post_update.py update.json [update2.json ...]
+#   python post_update.py --text /start --chat-id 123456789
+import argparse
+import json
+import time
+
+import httpx
+
+import settings
+
+
+def make_text_update(update_id: int, chat_id: int, text: str) -> dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private', 'username': f'user{chat_id}', 'first_name': 'Test'},
+        'from': {'id': chat_id, 'is_bot': False, 'username': f'user{chat_id}', 'first_name': 'Test'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Отправка апдейтов на локальный вебхук')
+    parser.add_argument('files', nargs='*', help='JSON-файлы с апдейтом или списком апдейтов')
+    parser.add_argument('--text', help='отправить сообщение с этим текстом вместо файлов')
+    parser.add_argument('--chat-id', type=int, default=1)
+    parser.add_argument('--url', default=f'http://{settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT}/{settings.WEBHOOK_PATH}')
+    parser.add_argument('--secret', default=settings.WEBHOOK_SECRET_TOKEN)
+    args = parser.parse_args()
+
+    updates = []
+    if args.text is not None:
+        updates.append(make_text_update(int(time.time()), args.chat_id, args.text))
+    for file in args.files:
+        with open(file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        updates.extend(data if isinstance(data, list) else [data])
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    with httpx.Client(timeout=10) as client:
+        for update in updates:
+            response = client.post(args.url, json=update, headers=headers)
+            print(f'update {update.get("update_id")}: {response.status_code}')
+
+
+if __name__ == '__main__':
+    main()
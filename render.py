@@ -0,0 +1,68 @@
+import string
+from typing import Any
+
+# https://core.telegram.org/bots/api#markdownv2-style
+MARKDOWN_V2_RESERVED = '\\_*[]()~`>#+-=|{}.!'
+_ESCAPE_TABLE = str.maketrans({char: '\\' + char for char in MARKDOWN_V2_RESERVED})
+
+
+def escape(value: Any) -> str:
+    """Экранирование всех зарезервированных символов MarkdownV2 за один проход."""
+    # Неотрицательные числа (а их в сообщениях большинство) экранировать не нужно
+    if value.__class__ is int and value >= 0:
+        return str(value)
+    return str(value).translate(_ESCAPE_TABLE)
+
+
+class Raw(str):
+    """Уже готовый MarkdownV2, который при подстановке в шаблон не экранируется."""
+
+
+class Template:
+    """
+    Шаблон сообщения, разобранный один раз при создании.
+    Текст шаблона пишется сразу в MarkdownV2 (разметка и экранирование как есть),
+    а подставляемые значения {name} экранируются при рендере.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: list[tuple[str, str | None]] = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(source):
+            if format_spec or conversion:
+                raise ValueError(f'Format specs are not supported in templates: {source!r}')
+            self._parts.append((literal, field))
+
+    def render_into(self, buffer: list[str], **values: Any) -> None:
+        self._render(buffer, values)
+
+    def _render(self, buffer: list[str], values: dict[str, Any]) -> None:
+        append = buffer.append
+        for literal, field in self._parts:
+            if literal:
+                append(literal)
+            if field is not None:
+                value = values[field]
+                # То же, что escape(), но без лишнего вызова функции на каждое поле
+                value_class = value.__class__
+                if value_class is Raw or value_class is int and value >= 0:
+                    append(str(value))
+                else:
+                    append(str(value).translate(_ESCAPE_TABLE))
+
+    def render(self, **values: Any) -> str:
+        buffer: list[str] = []
+        self._render(buffer, values)
+        return ''.join(buffer)
+
+
+class MessageBuilder:
+    def __init__(self):
+        self._buffer: list[str] = []
+
+    def add(self, template: Template, **values: Any) -> 'MessageBuilder':
+        template._render(self._buffer, values)
+        return self
+
+    def build(self) -> str:
+        return ''.join(self._buffer)
@@ -0,0 +1,192 @@
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # Пользователь ждет ответа (/start, ввод ника)
+    BACKGROUND = 10  # Фоновые и массовые задачи
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass(order=True)
+class _Request:
+    priority: int
+    seq: int
+    func: Callable[[], Awaitable[httpx.Response]] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    retries: int = field(default=0, compare=False)
+
+
+class SchedulerClosed(httpx.HTTPError):
+    """Планировщик закрыт, не дождавшись ответа. Наследник httpx.HTTPError - обрабатывается как ошибка соединения."""
+
+    def __init__(self):
+        super().__init__('Lichess request scheduler is closed')
+
+
+def parse_retry_after(value: Optional[str], default: float) -> float:
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return default
+
+
+class RequestScheduler:
+    """
+    Пропускает все запросы к Lichess через одну очередь с приоритетами и token bucket.
+    При ответе 429 очередь приостанавливается на Retry-After (или на минуту, как просит Lichess),
+    а запрос возвращается в очередь на свое место.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_concurrency: int,
+        rate_limit_pause: float = 60.0,
+        max_retries: int = 1,
+    ):
+        self._bucket = TokenBucket(rate, burst)
+        self._concurrency = asyncio.Semaphore(max_concurrency)
+        self._rate_limit_pause = rate_limit_pause
+        self._max_retries = max_retries
+        self._queue: asyncio.PriorityQueue[_Request] = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: dict[asyncio.Task, _Request] = {}
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def blocked_for(self) -> float:
+        return max(self._blocked_until - time.monotonic(), 0.0)
+
+    async def submit(
+        self,
+        func: Callable[[], Awaitable[httpx.Response]],
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> httpx.Response:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Request(priority, next(self._seq), func, future))
+        return await future
+
+    async def close(self) -> None:
+        """Останавливает очередь. Все, кто еще ждет ответа (в очереди или в полете), получают SchedulerClosed."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+
+        pending = list(self._running.values())
+        for task in list(self._running):
+            task.cancel()
+        if self._running:
+            await asyncio.wait(list(self._running))
+        # Запросы в полете после 429 могли вернуться в очередь - забираем их вместе с остальными
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(SchedulerClosed())
+
+    async def _wait_for_slot(self) -> None:
+        while True:
+            delay = self._blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._bucket.acquire()
+            if self._blocked_until <= time.monotonic():
+                return
+
+    async def _dispatch(self) -> None:
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._concurrency.acquire()
+            except asyncio.CancelledError:
+                # Запрос уже вынут из очереди: возвращаем, чтобы close() его не потерял
+                self._queue.put_nowait(request)
+                raise
+            try:
+                await self._wait_for_slot()
+            except asyncio.CancelledError:
+                self._concurrency.release()
+                self._queue.put_nowait(request)
+                raise
+            # Пока ждали слот, в очередь мог прийти более приоритетный запрос
+            if not self._queue.empty():
+                self._queue.put_nowait(request)
+                request = self._queue.get_nowait()
+            if request.future.done():
+                self._concurrency.release()
+                continue
+            task = asyncio.create_task(self._run(request))
+            self._running[task] = request
+            task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._running.pop(task, None)
+
+    async def _run(self, request: _Request) -> None:
+        try:
+            response = await request.func()
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        finally:
+            self._concurrency.release()
+
+        if response.status_code == 429:
+            pause = parse_retry_after(response.headers.get('Retry-After'), self._rate_limit_pause)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            logger.warning(f'Lichess вернул 429, запросы приостановлены на {pause:g} с')
+            if request.retries < self._max_retries and not request.future.done():
+                request.retries += 1
+                self._queue.put_nowait(request)
+                return
+
+        if request.future.done():
+            # Вызывающий перестал ждать (отменен): иначе потоковый ответ так и держал бы соединение
+            await response.aclose()
+            return
+        request.future.set_result(response)
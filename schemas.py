@@ -27,23 +27,25 @@ class GameType(StrEnum):
     CORRESPONDENCE = 'correspondence'
 
 
+HUMAN_TYPES = {
+    GameType.ULTRA_BULLET: 'Ультрапуля',
+    GameType.BULLET: 'Пуля',
+    GameType.BLITZ: 'Блиц',
+    GameType.RAPID: 'Рапид',
+    GameType.CLASSICAL: 'Классика',
+    GameType.ANTICHESS: 'Антишахматы (поддавки)',
+    GameType.ATOMIC: 'Атомные шахматы',
+    GameType.CHESS960: 'Chess 960',
+    GameType.CRAZYHOUSE: 'Crazyhouse',
+    GameType.HORDE: 'Орда',
+    GameType.KING_OF_THE_HILL: 'Король горы',
+    GameType.RACING_KINGS: 'Гонки королей',
+    GameType.THREE_CHECK: 'Три шаха',
+}
+
+
 def human_type(game_type: GameType) -> str:
-    type_map = {
-        GameType.ULTRA_BULLET: 'Ультрапуля',
-        GameType.BULLET: 'Пуля',
-        GameType.BLITZ: 'Блиц',
-        GameType.RAPID: 'Рапид',
-        GameType.CLASSICAL: 'Классика',
-        GameType.ANTICHESS: 'Антишахматы (поддавки)',
-        GameType.ATOMIC: 'Атомные шахматы',
-        GameType.CHESS960: 'Chess 960',
-        GameType.CRAZYHOUSE: 'Crazyhouse',
-        GameType.HORDE: 'Орда',
-        GameType.KING_OF_THE_HILL: 'Король горы',
-        GameType.RACING_KINGS: 'Гонки королей',
-        GameType.THREE_CHECK: 'Три шаха',
-    }
-    return type_map.get(game_type, game_type.value.title())
+    return HUMAN_TYPES.get(game_type, game_type.value.title())
 
 
 class Game(BaseModel):
@@ -66,14 +68,6 @@ class Game(BaseModel):
         del values[game_type]
         return values
 
-    def add(self, other):
-        assert isinstance(other, Game), 'Cannot add non-Game object'
-        assert self.type == other.type, 'Cannot add games of different types'
-        self.wins += other.wins
-        self.losses += other.losses
-        self.draws += other.draws
-        self.rating_before = other.rating_before
-
     @property
     def matches(self) -> int:
         return self.wins + self.losses + self.draws
@@ -94,12 +88,6 @@ class Puzzles(BaseModel):
         values["rating_after"] = values["score"]["rp"]["after"]
         return values
 
-    def add(self, other):
-        assert isinstance(other, Puzzles), 'Cannot add non-Puzzles object'
-        self.wins += other.wins
-        self.losses += other.losses
-        self.rating_before = other.rating_before
-
 
 class Tournament(BaseModel):
     id: str
@@ -169,14 +157,6 @@ class CorrespondenceMoves(BaseModel):
     class Config:
         extra = 'forbid'
 
-    def add(self, other):
-        assert isinstance(other, CorrespondenceMoves), 'Cannot add non-CorrespondenceMoves object'
-        self.total_moves += other.total_moves
-        opponents = set(game.opponent_username for game in self.games)
-        for game in other.games:
-            if game.opponent_username not in opponents:
-                self.games.append(game)
-
     @property
     def opponent_ratings(self) -> list[tuple[str, int]]:
         return [(game.opponent_username, game.opponent_rating,) for game in self.games]
@@ -203,17 +183,6 @@ class CorrespondenceEnds(BaseModel):
         del values["correspondence"]
         return values
 
-    def add(self, other):
-        assert isinstance(other, CorrespondenceEnds), 'Cannot add non-CorrespondenceEnds object'
-        self.wins += other.wins
-        self.losses += other.losses
-        self.draws += other.draws
-        self.rating_before = other.rating_before
-        opponents = set(game.opponent_username for game in self.games)
-        for game in other.games:
-            if game.opponent_username not in opponents:
-                self.games.append(game)
-
     @property
     def opponent_ratings(self) -> list[tuple[str, int]]:
         return [(game.opponent_username, game.opponent_rating,) for game in self.games]
@@ -254,78 +223,6 @@ class Activity(BaseModel):
         return values
 
 
-class GeneralActivity:
-    def __init__(self, activities: list[Activity]):
-        if not activities:
-            self._from_date = None
-            self._to_date = None
-            self._games = []
-            self._puzzles = None
-            self._correspondence_moves = None
-            self._correspondence_ends = None
-            return
-        activities.sort(key=lambda x: x.date, reverse=True)
-        self._from_date: date = activities[-1].date
-        self._to_date: date = activities[0].date
-        self._games: list[Game] = []
-        self._puzzles = None
-        self._correspondence_moves = None
-        self._correspondence_ends = None
-
-        games_by_type: dict[GameType, Game] = {}
-        for activity in activities:
-            if activity.games:
-                for game in activity.games:
-                    if game.type in games_by_type:
-                        games_by_type[game.type].add(game)
-                    else:
-                        games_by_type[game.type] = game
-
-            if activity.puzzles:
-                if self._puzzles is None:
-                    self._puzzles = activity.puzzles
-                else:
-                    self._puzzles.add(activity.puzzles)
-
-            if activity.correspondence_moves:
-                if self._correspondence_moves is None:
-                    self._correspondence_moves = activity.correspondence_moves
-                else:
-                    self._correspondence_moves.add(activity.correspondence_moves)
-
-            if activity.correspondence_ends:
-                if self._correspondence_ends is None:
-                    self._correspondence_ends = activity.correspondence_ends
-                else:
-                    self._correspondence_ends.add(activity.correspondence_ends)
-
-        self._games = list(games_by_type.values())
-
-    @property
-    def from_date(self) -> date:
-        return self._from_date
-
-    @property
-    def to_date(self) -> date:
-        return self._to_date
-
-    @property
-    def games(self) -> list[Game]:
-        return self._games
-
-    @property
-    def puzzles(self) -> Puzzles:
-        return self._puzzles
-
-    @property
-    def correspondence_moves(self) -> CorrespondenceMoves:
-        return self._correspondence_moves
-
-    @property
-    def correspondence_ends(self) -> CorrespondenceEnds:
-        return self._correspondence_ends
-
-
 class User(BaseModel):
     id: int
     tg_id: int
@@ -0,0 +1,111 @@
+import os
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+# HTTP-клиент Lichess
+LICHESS_BASE_URL = os.getenv('LICHESS_BASE_URL', 'https://lichess.org')
+LICHESS_CONNECT_TIMEOUT = _env_float('LICHESS_CONNECT_TIMEOUT', 5.0)
+LICHESS_READ_TIMEOUT = _env_float('LICHESS_READ_TIMEOUT', 15.0)
+LICHESS_MAX_CONNECTIONS = _env_int('LICHESS_MAX_CONNECTIONS', 20)
+LICHESS_MAX_KEEPALIVE_CONNECTIONS = _env_int('LICHESS_MAX_KEEPALIVE_CONNECTIONS', 10)
+LICHESS_KEEPALIVE_EXPIRY = _env_float('LICHESS_KEEPALIVE_EXPIRY', 60.0)
+
+# Кэш активности пользователей Lichess
+ACTIVITY_CACHE_TTL = _env_float('ACTIVITY_CACHE_TTL', 60.0)
+ACTIVITY_CACHE_MAX_ENTRIES = _env_int('ACTIVITY_CACHE_MAX_ENTRIES', 1000)
+ACTIVITY_CACHE_MAX_BYTES = _env_int('ACTIVITY_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+# Кэш готовых сообщений об активности (действительны, пока не изменился ответ Lichess)
+MESSAGE_CACHE_MAX_ENTRIES = _env_int('MESSAGE_CACHE_MAX_ENTRIES', 10000)
+MESSAGE_CACHE_MAX_BYTES = _env_int('MESSAGE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+
+# Ограничение частоты запросов к Lichess
+LICHESS_RATE = _env_float('LICHESS_RATE', 3.0)  # запросов в секунду
+LICHESS_BURST = _env_float('LICHESS_BURST', 6.0)
+LICHESS_MAX_CONCURRENT_REQUESTS = _env_int('LICHESS_MAX_CONCURRENT_REQUESTS', 4)
+LICHESS_RATE_LIMIT_PAUSE = _env_float('LICHESS_RATE_LIMIT_PAUSE', 60.0)
+LICHESS_RATE_LIMIT_RETRIES = _env_int('LICHESS_RATE_LIMIT_RETRIES', 1)
+
+# PostgreSQL
+DATABASE_URL = os.getenv('DATABASE_URL')  # Если не задан, используются параметры из data.py
+DB_POOL_MIN_SIZE = _env_int('DB_POOL_MIN_SIZE', 1)
+DB_POOL_MAX_SIZE = _env_int('DB_POOL_MAX_SIZE', 10)
+DB_STATEMENT_TIMEOUT = _env_float('DB_STATEMENT_TIMEOUT', 5.0)  # секунд
+DB_ACQUIRE_TIMEOUT = _env_float('DB_ACQUIRE_TIMEOUT', 10.0)
+DB_STATEMENT_CACHE_SIZE = _env_int('DB_STATEMENT_CACHE_SIZE', 100)  # 0 - для pgbouncer в режиме transaction
+
+# Состояние диалогов: 'postgres' (общее для нескольких процессов бота) или 'memory'
+CONVERSATION_STORE = os.getenv('CONVERSATION_STORE', 'postgres')
+CONVERSATION_STATE_TTL = _env_float('CONVERSATION_STATE_TTL', 24 * 60 * 60)  # сколько ждем ввода ника
+CONVERSATION_PURGE_INTERVAL = _env_float('CONVERSATION_PURGE_INTERVAL', 60 * 60)
+
+# Кэш пользователей бота. С общим хранилищем диалогов ник может поменять другой процесс бота,
+# поэтому записи по умолчанию устаревают; 0 - не устаревают (один процесс)
+USER_CACHE_MAX_ENTRIES = _env_int('USER_CACHE_MAX_ENTRIES', 10000)
+USER_CACHE_TTL = _env_float('USER_CACHE_TTL', 60 if CONVERSATION_STORE == 'postgres' else 0) or None
+USER_CACHE_WARM_UP = os.getenv('USER_CACHE_WARM_UP', '1') == '1'
+
+# Кэш ников Lichess
+USERNAME_CACHE_MAX_ENTRIES = _env_int('USERNAME_CACHE_MAX_ENTRIES', 10000)
+USERNAME_CACHE_TTL = _env_float('USERNAME_CACHE_TTL', 24 * 60 * 60)
+USERNAME_CACHE_NEGATIVE_TTL = _env_float('USERNAME_CACHE_NEGATIVE_TTL', 5 * 60)
+
+# Разбор активности: 'pydantic' (модели из schemas.py) или 'fast' (fast_schemas.py).
+# Значения читаются при каждом разборе, поэтому их можно менять во время работы бота
+ACTIVITY_DECODER = os.getenv('ACTIVITY_DECODER', 'pydantic')
+ACTIVITY_DECODER_STRICT = os.getenv('ACTIVITY_DECODER_STRICT', '1') == '1'
+
+# Рассылка сводок активности
+DIGEST_TIME = os.getenv('DIGEST_TIME', '10:00')  # по московскому времени
+DIGEST_WEEKLY_DAY = _env_int('DIGEST_WEEKLY_DAY', 1)  # 0 - воскресенье, 1 - понедельник, ...
+DIGEST_WINDOW = _env_float('DIGEST_WINDOW', 30 * 60)  # за сколько секунд нужно разослать все сводки
+DIGEST_LICHESS_CONCURRENCY = _env_int('DIGEST_LICHESS_CONCURRENCY', 2)
+DIGEST_SEND_RATE = _env_float('DIGEST_SEND_RATE', 20.0)  # сообщений в секунду, с запасом до лимита Telegram в 30
+
+# Хранить активность по дням в PostgreSQL (sql/activity.sql)
+ACTIVITY_STORE = os.getenv('ACTIVITY_STORE', '1') == '1'
+
+# Таблица лидеров /leaderboard (sql/ratings.sql)
+LEADERBOARD_REFRESH_INTERVAL = _env_float('LEADERBOARD_REFRESH_INTERVAL', 60 * 60)
+LEADERBOARD_SIZE = _env_int('LEADERBOARD_SIZE', 10)  # мест в таблице по одному виду игр
+LEADERBOARD_SUMMARY_SIZE = _env_int('LEADERBOARD_SUMMARY_SIZE', 3)  # мест по каждому виду в общей таблице
+
+# Сводка по последним партиям /games (выгрузка партий с Lichess)
+GAMES_SUMMARY_DEFAULT = _env_int('GAMES_SUMMARY_DEFAULT', 50)
+GAMES_SUMMARY_MAX = _env_int('GAMES_SUMMARY_MAX', 300)
+GAMES_SUMMARY_OPENINGS = _env_int('GAMES_SUMMARY_OPENINGS', 5)  # сколько дебютов показывать
+
+# Админская команда /_users
+USERS_PAGE_SIZE = _env_int('USERS_PAGE_SIZE', 25)
+
+# Режим работы: 'polling' (по умолчанию) или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+MAX_CONCURRENT_UPDATES = _env_int('MAX_CONCURRENT_UPDATES', 16)  # сколько апдейтов обрабатывается одновременно
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = _env_int('WEBHOOK_PORT', 8443)
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес, который регистрируется в Telegram
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+WEBHOOK_MAX_CONNECTIONS = _env_int('WEBHOOK_MAX_CONNECTIONS', 40)
+
+# Метрики в формате Prometheus: GET http://METRICS_LISTEN:METRICS_PORT/metrics (0 - не запускать)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = _env_int('METRICS_PORT', 9101)
+
+# Логи
+LOG_FILE = os.getenv('LOG_FILE', 'info.log')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' или 'json' (JSON Lines)
+LOG_ROTATION = os.getenv('LOG_ROTATION', 'size')  # 'size' или 'time'
+LOG_MAX_BYTES = _env_int('LOG_MAX_BYTES', 10 * 1024 * 1024)
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', 'midnight')
+LOG_BACKUP_COUNT = _env_int('LOG_BACKUP_COUNT', 7)
@@ -0,0 +1,103 @@
+# Локальный SSH/SFTP-сервер для проверки get_logs.py без настоящего сервера.
+# Отдает файлы из указанной папки, пускает с любым ключом, поддерживает сжатие.
+#
+#   python sftp_standin.py ./remote --port 2222
+#   python get_logs.py --host 127.0.0.1 --port 2222 --remote-dir / --output logs
+import argparse
+import os
+import socket
+import threading
+
+import paramiko
+from paramiko.sftp import SFTP_OP_UNSUPPORTED
+
+
+class StandInServer(paramiko.ServerInterface):
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == 'session' else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class StandInHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class StandInSFTP(paramiko.SFTPServerInterface):
+    """Только чтение: папка root видна клиенту как /."""
+    root = '.'
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, os.path.normpath('/' + path).lstrip('/'))
+
+    def list_folder(self, path):
+        try:
+            folder = self._path(path)
+            return [
+                paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(folder, name)), name)
+                for name in os.listdir(folder)
+            ]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return SFTP_OP_UNSUPPORTED
+        try:
+            handle = StandInHandle(flags)
+            handle.readfile = open(self._path(path), 'rb')
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def canonicalize(self, path):
+        return os.path.normpath('/' + path)
+
+
+def serve_connection(client: socket.socket, host_key: paramiko.PKey) -> None:
+    transport = paramiko.Transport(client)
+    transport.use_compression(True)
+    transport.add_server_key(host_key)
+    transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StandInSFTP)
+    transport.start_server(server=StandInServer())
+    while transport.is_active():
+        transport.join(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальный SFTP-сервер для проверки get_logs.py')
+    parser.add_argument('root', help='папка, которую видно по SFTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2222)
+    args = parser.parse_args()
+
+    StandInSFTP.root = os.path.abspath(args.root)
+    host_key = paramiko.RSAKey.generate(2048)
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((args.host, args.port))
+    server.listen()
+    print(f'SFTP stand-in for {StandInSFTP.root} on {args.host}:{args.port}')
+    while True:
+        client, _ = server.accept()
+        threading.Thread(target=serve_connection, args=(client, host_key), daemon=True).start()
+
+
+if __name__ == '__main__':
+    main()
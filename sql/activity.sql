@@ -0,0 +1,73 @@
+-- Активность игроков Lichess по дням. Ник хранится в нижнем регистре
+CREATE TABLE IF NOT EXISTS activity_days (
+    lichess_username TEXT NOT NULL,
+    day DATE NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (lichess_username, day)
+);
+
+
+CREATE TABLE IF NOT EXISTS activity_games (
+    lichess_username TEXT NOT NULL,
+    day DATE NOT NULL,
+    game_type TEXT NOT NULL,
+    position INT NOT NULL,
+    wins INT NOT NULL,
+    losses INT NOT NULL,
+    draws INT NOT NULL,
+    rating_before INT NOT NULL,
+    rating_after INT NOT NULL,
+    PRIMARY KEY (lichess_username, day, game_type),
+    FOREIGN KEY (lichess_username, day) REFERENCES activity_days ON DELETE CASCADE
+);
+
+
+CREATE TABLE IF NOT EXISTS activity_puzzles (
+    lichess_username TEXT NOT NULL,
+    day DATE NOT NULL,
+    wins INT NOT NULL,
+    losses INT NOT NULL,
+    rating_before INT NOT NULL,
+    rating_after INT NOT NULL,
+    PRIMARY KEY (lichess_username, day),
+    FOREIGN KEY (lichess_username, day) REFERENCES activity_days ON DELETE CASCADE
+);
+
+
+-- kind: 'moves' - ходы в партиях по переписке, 'ends' - завершенные партии
+CREATE TABLE IF NOT EXISTS activity_correspondence (
+    lichess_username TEXT NOT NULL,
+    day DATE NOT NULL,
+    kind TEXT NOT NULL CHECK (kind IN ('moves', 'ends')),
+    total_moves INT,
+    wins INT,
+    losses INT,
+    draws INT,
+    rating_before INT,
+    rating_after INT,
+    PRIMARY KEY (lichess_username, day, kind),
+    FOREIGN KEY (lichess_username, day) REFERENCES activity_days ON DELETE CASCADE
+);
+
+
+CREATE TABLE IF NOT EXISTS activity_correspondence_games (
+    lichess_username TEXT NOT NULL,
+    day DATE NOT NULL,
+    kind TEXT NOT NULL,
+    position INT NOT NULL,
+    game_id TEXT NOT NULL,
+    color TEXT NOT NULL,
+    url TEXT NOT NULL,
+    opponent_username TEXT NOT NULL,
+    opponent_rating INT NOT NULL,
+    PRIMARY KEY (lichess_username, day, kind, position),
+    FOREIGN KEY (lichess_username, day, kind) REFERENCES activity_correspondence ON DELETE CASCADE
+);
+
+
+CREATE OR REPLACE FUNCTION get_last_activity_day(p_lichess_username TEXT)
+RETURNS DATE AS $$
+BEGIN
+    RETURN (SELECT max(a.day) FROM activity_days a WHERE a.lichess_username = p_lichess_username);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,28 @@
+CREATE TABLE IF NOT EXISTS conversation_state (
+    chat_id BIGINT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at TIMESTAMPTZ,
+    PRIMARY KEY (chat_id, key)
+);
+
+CREATE INDEX IF NOT EXISTS conversation_state_expires_at_idx
+    ON conversation_state (expires_at) WHERE expires_at IS NOT NULL;
+
+
+-- Чтение, запись и удаление состояния записаны прямо в database.py (*_CONVERSATION_STATE_SQL)
+DROP FUNCTION IF EXISTS get_conversation_state(BIGINT, TEXT);
+DROP FUNCTION IF EXISTS set_conversation_state(BIGINT, TEXT, TEXT, DOUBLE PRECISION);
+DROP FUNCTION IF EXISTS delete_conversation_state(BIGINT, TEXT);
+
+
+CREATE OR REPLACE FUNCTION purge_conversation_state()
+RETURNS INT AS $$
+DECLARE
+    deleted INT;
+BEGIN
+    DELETE FROM conversation_state WHERE expires_at <= now();
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,37 @@
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    tg_id BIGINT PRIMARY KEY,
+    frequency TEXT NOT NULL CHECK (frequency IN ('daily', 'weekly')),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+
+CREATE OR REPLACE FUNCTION set_digest_subscription(
+    p_tg_id BIGINT,
+    p_frequency TEXT
+) RETURNS VOID AS $$
+BEGIN
+    IF p_frequency IS NULL THEN
+        DELETE FROM digest_subscriptions WHERE tg_id = p_tg_id;
+    ELSE
+        INSERT INTO digest_subscriptions (tg_id, frequency)
+        VALUES (p_tg_id, p_frequency)
+        ON CONFLICT (tg_id) DO UPDATE SET frequency = EXCLUDED.frequency;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION get_digest_recipients(p_frequency TEXT)
+RETURNS TABLE(
+    tg_id BIGINT,
+    lichess_username TEXT
+) AS $$
+BEGIN
+    RETURN QUERY
+    SELECT u.tg_id, u.lichess_username
+    FROM users u
+    JOIN digest_subscriptions d ON d.tg_id = u.tg_id
+    WHERE d.frequency = p_frequency AND u.lichess_username IS NOT NULL
+    ORDER BY u.lichess_username;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,49 @@
+-- Рейтинги пользователей бота на Lichess для /leaderboard. Таблицу заполняет фоновое обновление
+-- (leaderboard.py), команда только читает из нее первые строки по индексу.
+-- lichess_id - ник в нижнем регистре, lichess_username - каноническое написание для показа
+CREATE TABLE IF NOT EXISTS ratings (
+    lichess_id TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    lichess_username TEXT NOT NULL,
+    rating INT NOT NULL,
+    games INT NOT NULL,
+    provisional BOOLEAN NOT NULL,
+    week_change INT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (lichess_id, game_type)
+);
+
+-- Предварительные рейтинги (мало партий) в таблицы лидеров не попадают, как и на самом Lichess
+CREATE INDEX IF NOT EXISTS ratings_top_idx
+    ON ratings (game_type, rating DESC) WHERE NOT provisional;
+
+CREATE INDEX IF NOT EXISTS ratings_week_change_idx
+    ON ratings (game_type, week_change DESC) WHERE NOT provisional;
+
+
+-- Рейтинг на каждый день за последнюю неделю: от самого раннего считается изменение за неделю
+CREATE TABLE IF NOT EXISTS rating_history (
+    lichess_id TEXT NOT NULL,
+    game_type TEXT NOT NULL,
+    day DATE NOT NULL,
+    rating INT NOT NULL,
+    PRIMARY KEY (lichess_id, game_type, day)
+);
+
+
+-- Удаляет рейтинги игроков, которых больше нет среди пользователей бота, и историю старше недели
+CREATE OR REPLACE FUNCTION purge_ratings(p_day DATE)
+RETURNS INT AS $$
+DECLARE
+    deleted INT;
+BEGIN
+    DELETE FROM rating_history h
+    WHERE h.day < p_day - 7
+       OR NOT EXISTS (SELECT 1 FROM users u WHERE lower(u.lichess_username) = h.lichess_id);
+
+    DELETE FROM ratings r
+    WHERE NOT EXISTS (SELECT 1 FROM users u WHERE lower(u.lichess_username) = r.lichess_id);
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,4 +1,14 @@
-CREATE OR REPLACE FUNCTION get_user(p_tg_id BIGINT)
+-- Поиск по tg_id - самый частый запрос, и get_or_create_user опирается на эту уникальность
+CREATE UNIQUE INDEX IF NOT EXISTS users_tg_id_key ON users (tg_id);
+
+-- Чтение пользователя, добавление и смена ника - запросы горячего пути, они записаны прямо
+-- в database.py (GET_USER_SQL, GET_OR_CREATE_USER_SQL, UPDATE_LICHESS_USERNAME_SQL)
+DROP FUNCTION IF EXISTS get_user(BIGINT);
+DROP FUNCTION IF EXISTS add_user(BIGINT, VARCHAR, VARCHAR, VARCHAR);
+DROP FUNCTION IF EXISTS update_lichess_username(BIGINT, TEXT);
+
+
+CREATE OR REPLACE FUNCTION get_all_users()
 RETURNS TABLE(
     id INT,
     tg_id BIGINT,
@@ -11,12 +21,12 @@ BEGIN
     RETURN QUERY
     SELECT u.id, u.tg_id, u.tg_username, u.tg_first_name, u.tg_last_name, u.lichess_username
     FROM users u
-    WHERE u.tg_id = p_tg_id;
+    ORDER BY u.id;
 END;
 $$ LANGUAGE plpgsql;
 
 
-CREATE OR REPLACE FUNCTION get_all_users()
+CREATE OR REPLACE FUNCTION get_users_after(p_after_id INT, p_limit INT)
 RETURNS TABLE(
     id INT,
     tg_id BIGINT,
@@ -29,35 +39,28 @@ BEGIN
     RETURN QUERY
     SELECT u.id, u.tg_id, u.tg_username, u.tg_first_name, u.tg_last_name, u.lichess_username
     FROM users u
-    ORDER BY u.id;
+    WHERE u.id > p_after_id
+    ORDER BY u.id
+    LIMIT p_limit;
 END;
 $$ LANGUAGE plpgsql;
 
 
-CREATE OR REPLACE FUNCTION add_user(
-    p_tg_id BIGINT,
-    p_tg_username VARCHAR(32),
-    p_tg_first_name VARCHAR(64),
-    p_tg_last_name VARCHAR(64)
-) RETURNS INT AS $$
-DECLARE
-    v_id INT;
+CREATE OR REPLACE FUNCTION get_users_before(p_before_id INT, p_limit INT)
+RETURNS TABLE(
+    id INT,
+    tg_id BIGINT,
+    tg_username VARCHAR(32),
+    tg_first_name VARCHAR(64),
+    tg_last_name VARCHAR(64),
+    lichess_username TEXT
+) AS $$
 BEGIN
-    INSERT INTO users (tg_id, tg_username, tg_first_name, tg_last_name)
-    VALUES (p_tg_id, p_tg_username, p_tg_first_name, p_tg_last_name)
-    RETURNING id INTO v_id;
-    RETURN v_id;
+    RETURN QUERY
+    SELECT u.id, u.tg_id, u.tg_username, u.tg_first_name, u.tg_last_name, u.lichess_username
+    FROM users u
+    WHERE u.id < p_before_id
+    ORDER BY u.id DESC
+    LIMIT p_limit;
 END;
 $$ LANGUAGE plpgsql;
-
-
-CREATE OR REPLACE FUNCTION update_lichess_username(
-    p_tg_id BIGINT,
-    p_lichess_username TEXT
-) RETURNS VOID AS $$
-BEGIN
-    UPDATE users
-    SET lichess_username = p_lichess_username
-    WHERE tg_id = p_tg_id;
-END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Сохранение активности по дням в PostgreSQL (sql/activity.sql). Нужна отдельная тестовая база:
+
+    TEST_DATABASE_URL=postgresql://localhost/lichess_bot_test python -m unittest discover tests
+
+Без TEST_DATABASE_URL тесты пропускаются.
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import asyncpg  # noqa: E402
+
+import fast_schemas  # noqa: E402
+import settings  # noqa: E402
+from database import Database  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+FIXTURE = os.path.join(ROOT, 'benchmarks', 'fixtures', 'active.json')
+USERNAME = 'ActivityStoreTest'
+# Таблицу users миграции не создают (она старше sql/), а users.sql строит на ней индекс
+CREATE_USERS = '''
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    tg_id BIGINT NOT NULL,
+    tg_username VARCHAR(32),
+    tg_first_name VARCHAR(64),
+    tg_last_name VARCHAR(64),
+    lichess_username TEXT
+);
+'''
+
+
+@unittest.skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL не задан')
+class ActivityStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        settings.DATABASE_URL = TEST_DATABASE_URL
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        try:
+            await conn.execute(CREATE_USERS)
+        finally:
+            await conn.close()
+        self.db = Database()
+        await self.db.connect()
+        await self._delete_days()
+        with open(FIXTURE, 'rb') as f:
+            self.activities = fast_schemas.decode_activities(f.read())
+
+    async def asyncTearDown(self):
+        await self._delete_days()
+        await self.db.close()
+
+    async def _delete_days(self):
+        async with self.db._acquire() as conn:
+            await conn.execute('DELETE FROM activity_days WHERE lichess_username = $1;', USERNAME.lower())
+
+    async def test_concurrent_upserts_of_same_days(self):
+        # Два процесса бота одновременно обновляют одного игрока
+        for _ in range(10):
+            results = await asyncio.gather(
+                self.db.upsert_activity_days(USERNAME, self.activities),
+                self.db.upsert_activity_days(USERNAME, self.activities),
+            )
+            self.assertEqual(results, [True, True])
+
+        days = sorted(activity.date for activity in self.activities)
+        stored = await self.db.get_activity_days(USERNAME, since=days[0])
+        self.assertEqual(sorted(activity.date for activity in stored), days)
+        self.assertEqual(
+            sum(len(activity.games or []) for activity in stored),
+            sum(len(activity.games or []) for activity in self.activities),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()